@@ -0,0 +1,13 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def eager_tasks(settings):
+    """Фоновые задачи выполняются сразу: потоки не мешают очистке БД."""
+    settings.TASKS_EAGER = True
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    """Загрузки тестов пишутся во временный каталог, а не в MEDIA_ROOT."""
+    settings.MEDIA_ROOT = str(tmp_path)
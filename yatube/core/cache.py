@@ -0,0 +1,137 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date
+
+from .db import using_replica
+
+# Сколько секунд браузер и прокси могут не сверять страницу для гостя.
+ANONYMOUS_MAX_AGE: int = 30
+
+
+def _generation_key(scope):
+    return f'generation:{scope}'
+
+
+def invalidation_timeout():
+    """Срок жизни ключа, который сбрасывается записью, а не временем.
+
+    В кеше процесса такой ключ со временем создаётся заново, и сбросы
+    из других процессов становятся видны.
+    """
+    return None if settings.CACHE_SHARED else settings.VIEW_CACHE_TIMEOUT
+
+
+def generations(*scopes):
+    """Текущие поколения областей кеша в порядке перечисления."""
+    keys = [_generation_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, time.time_ns(), invalidation_timeout())
+            found[key] = cache.get(key)
+    return tuple(found[key] for key in keys)
+
+
+def bump(*scopes):
+    """Сбрасывает всё, что закешировано для перечисленных областей.
+
+    Поколение — время изменения в наносекундах, поэтому по нему же
+    строится Last-Modified.
+    """
+    now = time.time_ns()
+    cache.set_many({_generation_key(scope): now for scope in scopes},
+                   invalidation_timeout())
+
+
+def depend_on(request, *scopes):
+    """Добавляет области, от которых зависит кешируемая страница."""
+    if hasattr(request, 'cache_scopes'):
+        request.cache_scopes.extend(scopes)
+
+
+def _viewer(request):
+    if not request.user.is_authenticated:
+        return 'anonymous'
+    csrf_token = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+    return f'{request.user.pk}:{csrf_token}'
+
+
+def cached_view(scopes, timeout=None):
+    """Кеширует GET-ответы представления до смены поколения областей.
+
+    scopes получает аргументы представления и возвращает области,
+    известные до его вызова. Ключ зависит от зрителя, поэтому ответы
+    с пользовательскими данными не попадают к другим посетителям.
+    Без timeout ответ живёт settings.VIEW_CACHE_TIMEOUT секунд.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            versions = generations(*scopes(*args, **kwargs))
+            raw_key = ':'.join(map(str, (
+                _viewer(request), request.get_full_path(), *versions)))
+            key = f'view:{view.__name__}:' + hashlib.md5(
+                raw_key.encode()).hexdigest()
+            cached = cache.get(key)
+            if cached is not None:
+                depends, depends_versions, response = cached
+                if generations(*depends) == depends_versions:
+                    return response
+            request.cache_scopes = []
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                lifetime = timeout or settings.VIEW_CACHE_TIMEOUT
+                depends = tuple(request.cache_scopes)
+                cache.set(key, (depends, generations(*depends), response),
+                          min(lifetime, settings.REPLICA_CACHE_TIMEOUT)
+                          if using_replica() else lifetime)
+            return response
+        return wrapper
+    return decorator
+
+
+def conditional_view(scopes):
+    """Отвечает 304 на If-None-Match и If-Modified-Since до рендеринга.
+
+    ETag строится из зрителя, адреса и поколений областей кеша,
+    Last-Modified — из самого свежего поколения; базу для этого читать
+    не нужно. Страницы гостей можно хранить в общих кешах
+    ANONYMOUS_MAX_AGE секунд, страницы пользователей — только в браузере
+    и со сверкой при каждом показе.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            versions = generations(*scopes(*args, **kwargs))
+            raw_etag = ':'.join(map(str, (
+                _viewer(request), request.get_full_path(), *versions)))
+            etag = '"{}"'.format(hashlib.md5(raw_etag.encode()).hexdigest())
+            last_modified = max(versions) // 10 ** 9
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if response.status_code not in (200, 304):
+                return response
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            if request.user.is_authenticated:
+                patch_cache_control(response, private=True, no_cache=True)
+            else:
+                patch_cache_control(response, public=True,
+                                    max_age=ANONYMOUS_MAX_AGE)
+            # Гость и пользователь по одному адресу получают разные страницы.
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
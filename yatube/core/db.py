@@ -0,0 +1,79 @@
+import sqlite3
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+
+REPLICA_ALIAS = 'replica'
+
+# Псевдоним базы для чтения в текущем запросе; None — основная база.
+read_alias = ContextVar('read_alias', default=None)
+
+
+def pragma_statements(pragmas):
+    return [f'PRAGMA {name} = {value}' for name, value in pragmas.items()]
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    """Настраивает новое соединение SQLite прагмами профиля.
+
+    Прагмы выполняются на соединении DB-API в обход обёрток Django,
+    чтобы не попадать в счётчики запросов страницы.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    for statement in pragma_statements(settings.SQLITE_PRAGMAS):
+        connection.connection.execute(statement)
+
+
+def backup(source, target):
+    """Копирует файл SQLite через API резервного копирования.
+
+    Копия согласована, даже если в источник в это время пишут.
+    """
+    origin, copy = sqlite3.connect(source), sqlite3.connect(target)
+    try:
+        origin.backup(copy)
+    finally:
+        copy.close()
+        origin.close()
+
+
+def analyze():
+    """Обновляет статистику SQLite после массовой загрузки.
+
+    По ней планировщик выбирает индексы, а пагинатор оценивает число
+    строк без COUNT.
+    """
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+
+def using_replica():
+    return read_alias.get() is not None
+
+
+class ReplicaRouter:
+    """Отправляет чтение моделей REPLICA_APPS в реплику.
+
+    Реплика включается только на время представлений из REPLICA_VIEWS
+    (см. ReplicaMiddleware); всё остальное, включая любую запись, идёт
+    в основную базу.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = read_alias.get()
+        if alias and model._meta.app_label in settings.REPLICA_APPS:
+            return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # В реплике те же строки, что в основной базе.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == 'default'
@@ -0,0 +1,11 @@
+from django.core.mail import send_mail
+
+from .tasks import task
+
+
+@task(max_attempts=5)
+def send_email(subject, message, from_email, recipient_list,
+               html_message=None):
+    """Отправляет письмо из фоновой задачи."""
+    send_mail(subject, message, from_email, recipient_list,
+              html_message=html_message)
@@ -0,0 +1,35 @@
+import threading
+
+from django.core.management.base import BaseCommand
+
+from core.tasks import drain, work
+
+
+class Command(BaseCommand):
+    help = ('Разбирает очередь фоновых задач отдельно от сайта, например '
+            'при TASK_WORKERS = 0.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Число потоков-обработчиков.')
+        parser.add_argument('--once', action='store_true',
+                            help='Выполнить готовые задачи и выйти.')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            self.stdout.write(f'Выполнено задач: {drain()}')
+            return
+        stop = threading.Event()
+        threads = [
+            threading.Thread(target=work, args=(stop, threading.Event()),
+                             daemon=True, name=f'tasks-{number + 1}')
+            for number in range(options['workers'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f'Запущено обработчиков: {len(threads)}')
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            stop.set()
@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.db import REPLICA_ALIAS, backup
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в реплику: локальная замена '
+            'репликации для проверки чтения из реплики.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять каждые N секунд; 0 — один раз.')
+
+    def handle(self, *args, **options):
+        databases = settings.DATABASES
+        if any(databases[alias]['ENGINE'] != 'django.db.backends.sqlite3'
+               for alias in ('default', REPLICA_ALIAS)):
+            raise CommandError('Замена репликации работает только с SQLite.')
+        source = databases['default']['NAME']
+        target = databases[REPLICA_ALIAS]['NAME']
+        while True:
+            started = time.perf_counter()
+            backup(source, target)
+            self.stdout.write(
+                f'Реплика {target} обновлена за '
+                f'{(time.perf_counter() - started) * 1000:.0f} мс')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,175 @@
+import heapq
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .db import REPLICA_ALIAS, read_alias
+
+logger = logging.getLogger('core.queries')
+
+# Сколько самых медленных запросов попадает в журнал.
+SLOWEST_QUERIES: int = 3
+SQL_LOG_LENGTH: int = 300
+# Управление транзакциями не считается запросом к данным.
+TRANSACTION_STATEMENTS = ('SAVEPOINT', 'RELEASE SAVEPOINT',
+                          'ROLLBACK TO SAVEPOINT')
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+# Кука, по которой чтение после записи идёт в основную базу.
+PRIMARY_COOKIE = 'use_primary'
+
+
+def cache_tables():
+    """Таблицы DatabaseCache: их запросы не считаются запросами к данным."""
+    return tuple(
+        f'"{config["LOCATION"]}"' for config in settings.CACHES.values()
+        if config['BACKEND'].endswith('.DatabaseCache'))
+
+
+class QueryStats:
+    """Обёртка execute_wrapper, считающая запросы одного HTTP-запроса."""
+
+    def __init__(self, ignored_tables=()):
+        self.ignored_tables = ignored_tables
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = []
+        self.view_name = None
+
+    def __call__(self, execute, sql, params, many, context):
+        if (sql.startswith(TRANSACTION_STATEMENTS)
+                or any(table in sql for table in self.ignored_tables)):
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            item = (duration, self.count, sql)
+            if len(self.slowest) < SLOWEST_QUERIES:
+                heapq.heappush(self.slowest, item)
+            else:
+                heapq.heappushpop(self.slowest, item)
+
+    def slowest_queries(self):
+        """Самые медленные запросы, от долгого к быстрому."""
+        return [
+            {'ms': round(duration * 1000, 2),
+             'sql': sql[:SQL_LOG_LENGTH]}
+            for duration, _, sql in sorted(self.slowest, reverse=True)
+        ]
+
+
+def view_name(match):
+    """Имя представления по пространству приложения, а не экземпляра.
+
+    Например, posts:index; None, если URL не разрешён или без имени.
+    """
+    if match is None or not match.url_name:
+        return None
+    return ':'.join((*match.app_names, match.url_name))
+
+
+def query_budget(name):
+    """Допустимое число запросов представления или None."""
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(name)
+
+
+class QueryStatsMiddleware:
+    """Считает запросы к БД и время их выполнения для каждого запроса.
+
+    Итоги уходят в заголовок Server-Timing и в журнал core.queries;
+    превышение бюджета из QUERY_BUDGETS пишется как предупреждение.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.ignored_tables = cache_tables()
+
+    def __call__(self, request):
+        stats = request.query_stats = QueryStats(self.ignored_tables)
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+        stats.view_name = view_name(request.resolver_match)
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} SQL"',
+            f'app;dur={total * 1000:.2f}',
+        ))
+        self.log(request, response, stats, total)
+        return response
+
+    def log(self, request, response, stats, total):
+        budget = query_budget(stats.view_name)
+        over_budget = budget is not None and stats.count > budget
+        level = logging.WARNING if over_budget else logging.INFO
+        if not logger.isEnabledFor(level):
+            return
+        logger.log(level, json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': stats.view_name,
+            'status': response.status_code,
+            'queries': stats.count,
+            'budget': budget,
+            'db_ms': round(stats.duration * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+            'slowest': stats.slowest_queries(),
+        }, ensure_ascii=False))
+
+
+class WriteDetector:
+    """Обёртка execute_wrapper, замечающая запись в базу."""
+
+    def __init__(self, ignored_tables=()):
+        self.ignored_tables = ignored_tables
+        self.wrote = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if (sql.lstrip().upper().startswith(WRITE_STATEMENTS)
+                and not any(table in sql for table in self.ignored_tables)):
+            self.wrote = True
+        return execute(sql, params, many, context)
+
+
+class ReplicaMiddleware:
+    """Включает чтение из реплики для представлений из REPLICA_VIEWS.
+
+    Запрос, записавший что-то в основную базу, ставит куку: пока она
+    жива, чтение этого посетителя идёт в основную базу и он видит свои
+    изменения, даже если реплика отстаёт.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.ignored_tables = cache_tables()
+
+    def __call__(self, request):
+        detector = WriteDetector(self.ignored_tables)
+        token = read_alias.set(None)
+        try:
+            with connections['default'].execute_wrapper(detector):
+                response = self.get_response(request)
+        finally:
+            read_alias.reset(token)
+        if detector.wrote:
+            response.set_cookie(
+                PRIMARY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (settings.REPLICA_ENABLED
+                and request.method in ('GET', 'HEAD')
+                and PRIMARY_COOKIE not in request.COOKIES
+                and view_name(request.resolver_match)
+                in settings.REPLICA_VIEWS):
+            read_alias.set(REPLICA_ALIAS)
@@ -0,0 +1,44 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Task(models.Model):
+    """Фоновая задача в очереди; выполненные задачи удаляются."""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Не выполнена'),
+    )
+
+    name = models.CharField(verbose_name='Задача', max_length=255)
+    payload = models.TextField(verbose_name='Аргументы в JSON')
+    status = models.CharField(verbose_name='Состояние', max_length=10,
+                              choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(verbose_name='Попыток',
+                                           default=0)
+    max_attempts = models.PositiveIntegerField(
+        verbose_name='Наибольшее число попыток', default=3)
+    run_at = models.DateTimeField(verbose_name='Выполнить после',
+                                  default=timezone.now)
+    locked_until = models.DateTimeField(
+        verbose_name='Занята обработчиком до', null=True, blank=True)
+    last_error = models.TextField(verbose_name='Последняя ошибка',
+                                  blank=True)
+    created = models.DateTimeField(verbose_name='Дата постановки',
+                                   auto_now_add=True)
+
+    class Meta:
+        ordering = ['run_at', 'pk']
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            models.Index(fields=['status', 'run_at'],
+                         name='task_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.get_status_display()})'
@@ -0,0 +1,232 @@
+import json
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+# Как часто свободный обработчик заглядывает в очередь, в секундах.
+POLL_SECONDS: int = 5
+# Задача, обработчик которой пропал дольше этого, выполняется заново.
+LEASE_SECONDS: int = 60 * 5
+# Как часто выполняющаяся задача продлевает аренду.
+HEARTBEAT_SECONDS: int = LEASE_SECONDS // 3
+# Задержка перед повтором удваивается с каждой попыткой.
+RETRY_DELAY: int = 30
+ERROR_LENGTH: int = 2000
+LOST_ERROR = 'Обработчик пропал во время последней попытки'
+
+registry = {}
+
+
+def task(max_attempts=3):
+    """Регистрирует функцию как фоновую задачу.
+
+    Аргументы задачи должны сериализоваться в JSON. func.delay(...)
+    ставит задачу в очередь, func.delay_until(run_at, ...) — в очередь
+    на время не раньше run_at. func.delay_once_until(run_at) ставит
+    задачу без аргументов, только если она ещё не ждёт в очереди.
+    """
+    def decorator(func):
+        name = f'{func.__module__}.{func.__qualname__}'
+        registry[name] = func
+        func.task_name = name
+        func.max_attempts = max_attempts
+        func.delay = lambda *args, **kwargs: enqueue(func, args, kwargs)
+        func.delay_until = lambda run_at, *args, **kwargs: enqueue(
+            func, args, kwargs, run_at=run_at)
+        func.delay_once_until = lambda run_at: enqueue_once(func, run_at)
+        return func
+    return decorator
+
+
+def enqueue(func, args=(), kwargs=None, run_at=None):
+    """Ставит задачу в очередь; при TASKS_EAGER выполняет сразу.
+
+    Строка очереди пишется в текущей транзакции, поэтому задача
+    появляется, только если транзакция зафиксирована. Ошибка задачи,
+    выполненной сразу, как и в обработчике, только пишется в журнал.
+    """
+    kwargs = kwargs or {}
+    if settings.TASKS_EAGER:
+        try:
+            func(*args, **kwargs)
+        except Exception:
+            logger.exception('Задача %s завершилась ошибкой', func.task_name)
+        return None
+    queued = Task.objects.create(
+        name=func.task_name,
+        payload=json.dumps({'args': args, 'kwargs': kwargs},
+                           cls=DjangoJSONEncoder),
+        max_attempts=func.max_attempts,
+        run_at=run_at or timezone.now(),
+    )
+    if settings.TASK_WORKERS:
+        transaction.on_commit(pool.wake)
+    return queued
+
+
+def enqueue_once(func, run_at):
+    """Ставит периодическую задачу, если она ещё не ждёт в очереди."""
+    if not settings.TASKS_EAGER and Task.objects.filter(
+            name=func.task_name, status=Task.PENDING).exists():
+        return None
+    return enqueue(func, run_at=run_at)
+
+
+def _resolve(name):
+    if name not in registry:
+        # Модуль задачи регистрирует её при импорте.
+        import_string(name)
+    return registry[name]
+
+
+def _lost(now):
+    return Q(status=Task.RUNNING, locked_until__lt=now)
+
+
+def _ready(now):
+    return (Q(status=Task.PENDING, run_at__lte=now)
+            | _lost(now) & Q(attempts__lt=F('max_attempts')))
+
+
+def claim():
+    """Забирает первую готовую задачу или возвращает None.
+
+    Задачу забирает тот, чей UPDATE с тем же условием изменил строку,
+    поэтому обработчики в разных потоках и процессах не мешают друг другу.
+    Пропавшая задача без оставшихся попыток помечается невыполненной,
+    иначе она падала бы с обработчиком бесконечно.
+    """
+    Task.objects.filter(
+        _lost(timezone.now()), attempts__gte=F('max_attempts')
+    ).update(status=Task.FAILED, locked_until=None, last_error=LOST_ERROR)
+    while True:
+        now = timezone.now()
+        task_id = Task.objects.filter(_ready(now)).order_by(
+            'run_at', 'pk').values_list('pk', flat=True).first()
+        if task_id is None:
+            return None
+        if Task.objects.filter(_ready(now), pk=task_id).update(
+                status=Task.RUNNING, attempts=F('attempts') + 1,
+                locked_until=now + timedelta(seconds=LEASE_SECONDS)):
+            return Task.objects.get(pk=task_id)
+
+
+def _heartbeat(queued, done):
+    """Продлевает аренду задачи, пока она выполняется.
+
+    Без этого задача дольше LEASE_SECONDS досталась бы второму
+    обработчику и выполнялась бы дважды, например, повторно рассылая
+    ещё не отмеченные письма.
+    """
+    try:
+        while not done.wait(HEARTBEAT_SECONDS):
+            Task.objects.filter(
+                pk=queued.pk, status=Task.RUNNING, attempts=queued.attempts
+            ).update(locked_until=timezone.now()
+                     + timedelta(seconds=LEASE_SECONDS))
+    except Exception:
+        logger.exception('Не удалось продлить аренду задачи %s', queued.name)
+    finally:
+        connections.close_all()
+
+
+def _execute(queued):
+    done = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(queued, done),
+                                 daemon=True)
+    heartbeat.start()
+    try:
+        payload = json.loads(queued.payload)
+        _resolve(queued.name)(*payload['args'], **payload['kwargs'])
+    finally:
+        done.set()
+        heartbeat.join()
+
+
+def run(queued):
+    """Выполняет забранную задачу; при ошибке откладывает повтор."""
+    try:
+        _execute(queued)
+    except Exception:
+        logger.exception('Задача %s завершилась ошибкой', queued.name)
+        error = traceback.format_exc()[-ERROR_LENGTH:]
+        tasks = Task.objects.filter(pk=queued.pk)
+        if queued.attempts >= queued.max_attempts:
+            tasks.update(status=Task.FAILED, locked_until=None,
+                         last_error=error)
+        else:
+            delay = RETRY_DELAY * 2 ** (queued.attempts - 1)
+            tasks.update(status=Task.PENDING, locked_until=None,
+                         last_error=error,
+                         run_at=timezone.now() + timedelta(seconds=delay))
+        return False
+    Task.objects.filter(pk=queued.pk).delete()
+    return True
+
+
+def drain():
+    """Выполняет все готовые задачи и возвращает их число."""
+    done = 0
+    while True:
+        queued = claim()
+        if queued is None:
+            return done
+        run(queued)
+        done += 1
+
+
+def work(stop, wakeup):
+    """Цикл обработчика: разбирает очередь, пока не попросят остановиться."""
+    while not stop.is_set():
+        try:
+            drain()
+        except Exception:
+            logger.exception('Обработчик очереди задач упал')
+        finally:
+            close_old_connections()
+        wakeup.wait(POLL_SECONDS)
+        wakeup.clear()
+
+
+class WorkerPool:
+    """Потоки-обработчики очереди внутри процесса сайта."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.wakeup = threading.Event()
+        self.threads = []
+
+    def start(self, workers):
+        with self.lock:
+            while len(self.threads) < workers:
+                thread = threading.Thread(
+                    target=work, args=(self.stop, self.wakeup), daemon=True,
+                    name=f'tasks-{len(self.threads) + 1}')
+                thread.start()
+                self.threads.append(thread)
+
+    def wake(self):
+        self.start(settings.TASK_WORKERS)
+        self.wakeup.set()
+
+
+pool = WorkerPool()
+
+
+def start_workers():
+    """Запускает TASK_WORKERS обработчиков, если очередь не синхронная."""
+    if settings.TASK_WORKERS and not settings.TASKS_EAGER:
+        pool.start(settings.TASK_WORKERS)
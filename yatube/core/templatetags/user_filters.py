@@ -6,3 +6,14 @@ register = template.Library()
 @register.filter
 def addclass(field, css):
     return field.as_widget(attrs={'class': css})
+
+
+@register.simple_tag(takes_context=True)
+def page_url(context, **kwargs):
+    """Ссылка на страницу списка с сохранением остальных GET-параметров."""
+    query = context['request'].GET.copy()
+    for key in ('page', 'cursor'):
+        query.pop(key, None)
+    for key, value in kwargs.items():
+        query[key] = value
+    return '?' + query.urlencode() if query else '?'
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+from .middleware import query_budget
+
+
+class TestRunner(DiscoverRunner):
+    """Запускает тесты с синхронной очередью задач."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.TASKS_EAGER = True
+
+
+def assert_query_budget(response, budget=None):
+    """Падает, если представление выполнило больше запросов, чем можно.
+
+    Бюджет берётся из QUERY_BUDGETS по имени представления, если не
+    передан явно. Подходит и для pytest, и для unittest.
+    """
+    stats = getattr(response.wsgi_request, 'query_stats', None)
+    if stats is None:
+        raise AssertionError('QueryStatsMiddleware не подключён')
+    if budget is None:
+        budget = query_budget(stats.view_name)
+    if budget is None:
+        raise AssertionError(
+            f'Для представления {stats.view_name} не задан бюджет запросов')
+    if stats.count > budget:
+        slowest = '\n'.join(
+            f'{query["ms"]} мс: {query["sql"]}'
+            for query in stats.slowest_queries())
+        raise AssertionError(
+            f'{stats.view_name}: {stats.count} запросов при бюджете '
+            f'{budget}. Самые медленные:\n{slowest}')
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Group, Post, Comment, Follow
+from .models import Group, Post, Comment, Follow, Notification
+from .search import match_posts
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -10,8 +11,14 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return match_posts(queryset, search_term), False
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
 admin.site.register(Comment)
 admin.site.register(Follow)
+admin.site.register(Notification)
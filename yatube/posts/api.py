@@ -0,0 +1,103 @@
+import hashlib
+import json
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from .models import Group, Post, User
+from .utils import LAST_POSTS, CursorPaginator
+
+CONTENT_TYPE = 'application/json; charset=utf-8'
+
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def post_data(post):
+    """Пост в ответе API: те же поля, что выводит карточка ленты."""
+    author = post.author
+    if post.thumbnail:
+        image = post.thumbnail
+    elif post.image:
+        image = post.image.url
+    else:
+        image = None
+    return {
+        'id': post.pk,
+        'text': post.text,
+        'pub_date': post.pub_date.isoformat(),
+        'author': author.username,
+        'author_name': author.get_full_name(),
+        'group': post.group.slug if post.group_id else None,
+        'image': image,
+        'comment_count': post.comment_count,
+    }
+
+
+def page_etag(page, extra, results):
+    """Сильный ETag страницы по её сериализованным полям.
+
+    Версии поста не хватает: имя автора и адрес группы меняются без
+    сохранения поста, а счётчик комментариев и миниатюра — без
+    обновления updated_at.
+    """
+    digest = hashlib.md5(_dumps(extra).encode())
+    digest.update(_dumps(results).encode())
+    digest.update(b'next' if page.has_next() else b'last')
+    return f'"{digest.hexdigest()}"'
+
+
+def error(status, detail):
+    return HttpResponse(_dumps({'detail': detail}), status=status,
+                        content_type=CONTENT_TYPE)
+
+
+def feed_response(request, queryset, **extra):
+    """Страница ленты в JSON с ответом 304 для неизменившейся страницы.
+
+    Страница читается одним запросом; при совпадении ETag ответ
+    отдаётся без тела.
+    """
+    page = CursorPaginator(queryset, LAST_POSTS).get_page(
+        request.GET.get('cursor'))
+    results = [post_data(post) for post in page]
+    etag = page_etag(page, extra, results)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(_dumps({
+            **extra,
+            'results': results,
+            'next_cursor': page.next_cursor,
+            'previous_cursor': page.previous_cursor,
+        }), content_type=CONTENT_TYPE)
+    response['ETag'] = etag
+    # Клиент хранит ответ, но каждый раз сверяет его по ETag.
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def index(request):
+    return feed_response(request, Post.objects.for_listing())
+
+
+def group_posts(request, slug):
+    group = Group.objects.filter(slug=slug).only(
+        'slug', 'title', 'description').first()
+    if group is None:
+        return error(404, 'Группа не найдена')
+    return feed_response(
+        request, group.selected_posts.for_listing(),
+        group={'slug': group.slug, 'title': group.title,
+               'description': group.description})
+
+
+def profile(request, username):
+    author = User.objects.filter(username=username).only(
+        'username', 'first_name', 'last_name').first()
+    if author is None:
+        return error(404, 'Автор не найден')
+    return feed_response(
+        request, author.posts.for_listing(),
+        author={'username': author.username,
+                'name': author.get_full_name()})
@@ -0,0 +1,234 @@
+import json
+from contextlib import contextmanager
+
+from django.core import serializers
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from . import follows
+from .models import Comment, Follow, Group, Post, User
+
+READ_CHUNK: int = 1 << 16
+# Поля выгрузки: без m2m пользователя, которые стоили бы запроса на объект.
+EXPORT_FIELDS = {
+    User: ('password', 'last_login', 'is_superuser', 'username',
+           'first_name', 'last_name', 'email', 'is_staff', 'is_active',
+           'date_joined'),
+    Group: ('title', 'slug', 'description'),
+    Post: ('text', 'pub_date', 'author', 'group', 'image'),
+    Comment: ('text', 'author', 'post', 'created'),
+    Follow: ('user', 'author'),
+}
+# Порядок сброса пачек: сначала то, на что ссылаются остальные.
+IMPORT_ORDER = ('auth.user', 'posts.group', 'posts.post', 'posts.comment',
+                'posts.follow')
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """Позволяет задать даты полям с auto_now_add при bulk_create."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def _iter_array(stream, buffer):
+    decoder = json.JSONDecoder()
+    buffer = buffer[buffer.index('[') + 1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            record, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = stream.read(READ_CHUNK)
+            if not chunk:
+                raise ValueError('Выгрузка обрывается посреди записи')
+            buffer += chunk
+            continue
+        yield record
+        buffer = buffer[end:]
+
+
+def iter_records(stream):
+    """Записи выгрузки по одной, не читая файл целиком.
+
+    Понимает JSON Lines и массив в формате dumpdata.
+    """
+    buffer = stream.read(READ_CHUNK)
+    if buffer.lstrip().startswith('['):
+        yield from _iter_array(stream, buffer)
+        return
+    for line in (buffer + stream.readline()).splitlines():
+        if line.strip():
+            yield json.loads(line)
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def export_records(batch_size):
+    """Записи для выгрузки в порядке, пригодном для загрузки."""
+    for model, fields in EXPORT_FIELDS.items():
+        queryset = model.objects.order_by('pk').iterator(
+            chunk_size=batch_size)
+        chunk = []
+        for obj in queryset:
+            chunk.append(obj)
+            if len(chunk) == batch_size:
+                yield from serializers.serialize(
+                    'python', chunk, fields=fields)
+                chunk = []
+        yield from serializers.serialize('python', chunk, fields=fields)
+
+
+def _known_fields(model, record):
+    return {field: value for field, value in record['fields'].items()
+            if field in EXPORT_FIELDS[model]}
+
+
+def dump_record(record):
+    return json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+class Importer:
+    """Загружает записи пачками bulk_create, каждую в своей транзакции.
+
+    Пользователи и группы сопоставляются по username и slug через
+    словари старых id в новые. Посты получают новые id, их словарь
+    передаётся в posts при продолжении: по нему комментарии находят
+    свои посты. Что уже загружено, определяет только skip.
+    """
+
+    def __init__(self, batch_size, skip=0, posts=None):
+        self.batch_size = batch_size
+        self.skip = skip
+        self.users = {}
+        self.groups = {}
+        self.posts = dict(posts or {})
+        # Посты последнего сброса: их нужно дописать в файл прогресса.
+        self.flushed_posts = {}
+        self.buffers = {label: [] for label in IMPORT_ORDER}
+        self.created = dict.fromkeys(IMPORT_ORDER, 0)
+        self.skipped = dict.fromkeys(IMPORT_ORDER, 0)
+        self.ignored = 0
+        self.records = 0
+
+    def add(self, record):
+        """Добавляет запись; возвращает True, если пачка сброшена."""
+        self.records += 1
+        label = record.get('model')
+        if label not in self.buffers:
+            self.ignored += 1
+            return False
+        # При продолжении пользователи и группы читаются заново: без них
+        # не сопоставить ссылки следующих записей.
+        if self.records <= self.skip and label not in (
+                'auth.user', 'posts.group'):
+            return False
+        self.buffers[label].append(record)
+        if sum(map(len, self.buffers.values())) >= self.batch_size:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        self.flushed_posts = {}
+        with transaction.atomic():
+            for label in IMPORT_ORDER:
+                records, self.buffers[label] = self.buffers[label], []
+                if records:
+                    getattr(self, '_load_' + label.split('.')[1])(records)
+
+    def _count(self, label, created, total):
+        self.created[label] += created
+        self.skipped[label] += total - created
+
+    def _load_user(self, records):
+        names = {record['fields']['username']: record for record in records}
+        existing = dict(User.objects.filter(
+            username__in=names).values_list('username', 'pk'))
+        User.objects.bulk_create(
+            User(**_known_fields(User, record))
+            for name, record in names.items() if name not in existing)
+        self._count('auth.user', len(names) - len(existing), len(records))
+        ids = dict(User.objects.filter(
+            username__in=names).values_list('username', 'pk'))
+        for name, record in names.items():
+            self.users[record['pk']] = ids[name]
+
+    def _load_group(self, records):
+        slugs = {record['fields']['slug']: record for record in records}
+        existing = set(Group.objects.filter(
+            slug__in=slugs).values_list('slug', flat=True))
+        Group.objects.bulk_create(
+            Group(**_known_fields(Group, record))
+            for slug, record in slugs.items() if slug not in existing)
+        self._count('posts.group', len(slugs) - len(existing), len(records))
+        ids = dict(Group.objects.filter(
+            slug__in=slugs).values_list('slug', 'pk'))
+        for slug, record in slugs.items():
+            self.groups[record['pk']] = ids[slug]
+
+    def _load_post(self, records):
+        old_ids = []
+        posts = []
+        for record in records:
+            fields = record['fields']
+            author_id = self.users.get(fields['author'])
+            if author_id is None:
+                continue
+            old_ids.append(record['pk'])
+            posts.append(Post(
+                text=fields['text'],
+                pub_date=parse_datetime(fields['pub_date']),
+                author_id=author_id,
+                group_id=self.groups.get(fields.get('group')),
+                image=fields.get('image') or '',
+            ))
+        if not posts:
+            self._count('posts.post', 0, len(records))
+            return
+        with explicit_dates(Post._meta.get_field('pub_date')):
+            Post.objects.bulk_create(posts)
+        # SQLite не возвращает id из bulk_create. Запись в базу занята
+        # этой транзакцией с первого INSERT, а AUTOINCREMENT раздаёт id
+        # по возрастанию, поэтому последние len(posts) id — наши, в том
+        # же порядке.
+        new_ids = sorted(Post.objects.order_by('-pk').values_list(
+            'pk', flat=True)[:len(posts)])
+        self.flushed_posts = dict(zip(old_ids, new_ids))
+        self.posts.update(self.flushed_posts)
+        self._count('posts.post', len(posts), len(records))
+
+    def _load_comment(self, records):
+        comments = []
+        for record in records:
+            fields = record['fields']
+            author_id = self.users.get(fields['author'])
+            post_id = self.posts.get(fields['post'])
+            if author_id is None or post_id is None:
+                continue
+            comments.append(Comment(
+                text=fields['text'], author_id=author_id, post_id=post_id,
+                created=parse_datetime(fields['created']),
+            ))
+        with explicit_dates(Comment._meta.get_field('created')):
+            Comment.objects.bulk_create(comments)
+        self._count('posts.comment', len(comments), len(records))
+
+    def _load_follow(self, records):
+        created = follows.insert_pairs(
+            (self.users[record['fields']['user']],
+             self.users[record['fields']['author']])
+            for record in records
+            if record['fields']['user'] in self.users
+            and record['fields']['author'] in self.users
+        )
+        self._count('posts.follow', created, len(records))
@@ -0,0 +1,119 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+
+
+def _count(queryset, field):
+    """Подзапрос с количеством строк queryset для внешней строки."""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by()
+        .values(field).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def _author_counts():
+    return {
+        'posts_count': _count(Post.objects, 'author'),
+        'followers_count': _count(Follow.objects, 'author'),
+        'following_count': _count(Follow.objects, 'user'),
+    }
+
+
+def _increment(queryset, **deltas):
+    return queryset.update(
+        **{field: F(field) + delta for field, delta in deltas.items()})
+
+
+def change_author(user_id, **deltas):
+    """Атомарно меняет счётчики автора, при необходимости создавая строку.
+
+    Недостающая строка создаётся сразу с точными значениями; уменьшение
+    счётчиков её не создаёт, чтобы не мешать каскадному удалению автора.
+    """
+    if deltas and _increment(
+            AuthorStats.objects.filter(user_id=user_id), **deltas):
+        return
+    if any(delta < 0 for delta in deltas.values()):
+        return
+    try:
+        with transaction.atomic():
+            AuthorStats.objects.create(user_id=user_id)
+    except IntegrityError:
+        if deltas:
+            _increment(AuthorStats.objects.filter(user_id=user_id), **deltas)
+    else:
+        AuthorStats.objects.filter(user_id=user_id).update(**_author_counts())
+
+
+def change_authors(user_ids, **deltas):
+    """То же, что change_author, для многих авторов за пару запросов."""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    existing = set(AuthorStats.objects.filter(
+        user_id__in=user_ids).values_list('user_id', flat=True))
+    if existing:
+        _increment(AuthorStats.objects.filter(user_id__in=existing),
+                   **deltas)
+    missing = user_ids - existing
+    if not missing or any(delta < 0 for delta in deltas.values()):
+        return
+    AuthorStats.objects.bulk_create(
+        (AuthorStats(user_id=user_id) for user_id in missing),
+        ignore_conflicts=True,
+    )
+    AuthorStats.objects.filter(user_id__in=missing).update(
+        **_author_counts())
+
+
+def change_post(post_id, delta):
+    _increment(Post.objects.filter(pk=post_id), comment_count=delta)
+
+
+def change_group(group_id, delta):
+    if group_id is not None:
+        _increment(Group.objects.filter(pk=group_id), post_count=delta)
+
+
+def author_stats(user):
+    """Счётчики автора для страниц; в базу ничего не пишет.
+
+    Строка создаётся вместе с пользователем, но реплика может её ещё
+    не получить: тогда она читается из основной базы. Её нет только у
+    пользователей из массовой загрузки до recount, для них счётчики
+    нулевые.
+    """
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        pass
+    return (AuthorStats.objects.using('default').filter(user=user).first()
+            or AuthorStats(user=user))
+
+
+def _repair(queryset, **counts):
+    drifted = Q()
+    for field in counts:
+        drifted |= ~Q(**{field: F(f'actual_{field}')})
+    stale = queryset.annotate(**{
+        f'actual_{field}': value for field, value in counts.items()
+    }).filter(drifted)
+    return queryset.filter(pk__in=stale.values('pk')).update(**counts)
+
+
+def recount():
+    """Пересчитывает все счётчики и возвращает число исправленных строк."""
+    AuthorStats.objects.bulk_create(
+        (AuthorStats(user_id=user_id) for user_id in User.objects.filter(
+            stats__isnull=True).values_list('pk', flat=True).iterator()),
+        batch_size=500,
+    )
+    return {
+        'authors': _repair(AuthorStats.objects, **_author_counts()),
+        'posts': _repair(Post.objects,
+                         comment_count=_count(Comment.objects, 'post')),
+        'groups': _repair(Group.objects,
+                          post_count=_count(Post.objects, 'group')),
+    }
@@ -0,0 +1,213 @@
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from core.tasks import task
+
+from .models import AuthorStats, FeedEntry, Follow, Post
+from .utils import POST_ORDERING, CursorPaginator
+
+# Авторы, у которых подписчиков больше этого числа, не раскладывают
+# новые посты по лентам: их посты подмешиваются при чтении ленты.
+FANOUT_LIMIT: int = 1000
+# Сколько последних постов автора попадает в ленту при подписке.
+BACKFILL_LIMIT: int = 500
+BATCH_SIZE: int = 500
+# Длина ленты: более старые записи удаляются после раскладки поста.
+INBOX_LIMIT: int = 1000
+# Сколько лент обрезается одним запросом: SQLite ограничивает число
+# параметров.
+CAP_BATCH: int = 400
+FEED_ORDERING = ('-pub_date', '-post_id')
+POPULAR_AUTHORS_KEY = 'feed:popular_authors'
+POPULAR_AUTHORS_TIMEOUT: int = 60 * 5
+
+
+def popular_authors():
+    """Возвращает id авторов, чьи посты не раскладываются по лентам.
+
+    Читается диапазон индекса по счётчику подписчиков в AuthorStats.
+    """
+    author_ids = cache.get(POPULAR_AUTHORS_KEY)
+    if author_ids is None:
+        author_ids = set(AuthorStats.objects.filter(
+            followers_count__gt=FANOUT_LIMIT).values_list('user', flat=True))
+        cache.set(POPULAR_AUTHORS_KEY, author_ids, POPULAR_AUTHORS_TIMEOUT)
+    return author_ids
+
+
+@task()
+def fan_out(post_id):
+    """Раскладывает новый пост по лентам подписчиков автора.
+
+    Обрезаются только ленты, в которые пост попал.
+    """
+    post = Post.objects.filter(pk=post_id).only(
+        'author', 'pub_date').first()
+    if post is None:
+        return
+    if AuthorStats.objects.filter(user_id=post.author_id,
+                                  followers_count__gt=FANOUT_LIMIT).exists():
+        cache.delete(POPULAR_AUTHORS_KEY)
+        return
+    followers = list(Follow.objects.filter(
+        author_id=post.author_id).values_list('user', flat=True))
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, post_id=post.pk,
+                   author_id=post.author_id, pub_date=post.pub_date)
+         for user_id in followers),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    for start in range(0, len(followers), CAP_BATCH):
+        cap(followers[start:start + CAP_BATCH])
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту подписчика последние посты автора."""
+    if author_id in popular_authors():
+        return
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'pk', 'pub_date')[:BACKFILL_LIMIT]
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, post_id=post_id,
+                   author_id=author_id, pub_date=pub_date)
+         for post_id, pub_date in posts),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_many(user_id, author_ids):
+    """Добавляет в ленту последние посты нескольких авторов одним запросом."""
+    popular = popular_authors()
+    author_ids = [int(author_id) for author_id in author_ids
+                  if author_id not in popular]
+    if not author_ids:
+        return 0
+    feed_table = FeedEntry._meta.db_table
+    placeholders = ', '.join(['%s'] * len(author_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            INSERT INTO {feed_table} (user_id, post_id, author_id, pub_date)
+            SELECT %s, id, author_id, pub_date FROM (
+                SELECT id, author_id, pub_date, ROW_NUMBER() OVER (
+                    PARTITION BY author_id ORDER BY pub_date DESC
+                ) AS position
+                FROM {Post._meta.db_table}
+                WHERE author_id IN ({placeholders})
+            ) WHERE position <= %s
+            ON CONFLICT DO NOTHING
+        ''', [user_id, *author_ids, BACKFILL_LIMIT])
+        return cursor.rowcount
+
+
+def trim(user_id, author_id):
+    """Убирает посты автора из ленты отписавшегося пользователя."""
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+class FeedPaginator(CursorPaginator):
+    """Лента подписок по курсору на записях ленты.
+
+    Страница — один диапазон индекса (user, -pub_date, -post) в
+    материализованной ленте; посты популярных авторов читаются тем же
+    ключом и сливаются с ней. Сами посты загружаются только для
+    выбранной страницы.
+    """
+
+    def __init__(self, user, per_page):
+        super().__init__(
+            FeedEntry.objects.filter(user=user).only('post', 'pub_date'),
+            per_page, FEED_ORDERING)
+        popular = popular_authors()
+        self.pulled = []
+        if popular:
+            self.pulled = list(Follow.objects.filter(
+                user=user, author__in=popular).values_list(
+                'author', flat=True))
+
+    def fetch(self, values, forward):
+        entries = super().fetch(values, forward)
+        if not self.pulled:
+            return entries
+        posts = Post.objects.filter(author__in=self.pulled).order_by(
+            *POST_ORDERING)
+        if values is not None:
+            posts = posts.filter(
+                self.keyset_filter(values, forward, POST_ORDERING))
+        if not forward:
+            posts = posts.reverse()
+        entries += [
+            FeedEntry(post_id=post_id, pub_date=pub_date)
+            for post_id, pub_date in posts.values_list(
+                'pk', 'pub_date')[:self.per_page + 1]
+        ]
+        merged = {entry.post_id: entry for entry in entries}.values()
+        return sorted(merged, key=lambda entry: (entry.pub_date,
+                                                 entry.post_id),
+                      reverse=forward)[:self.per_page + 1]
+
+    def load(self, object_list):
+        posts = Post.objects.for_listing().in_bulk(
+            [entry.post_id for entry in object_list])
+        return [posts[entry.post_id] for entry in object_list
+                if entry.post_id in posts]
+
+
+def cap(user_ids=None):
+    """Оставляет в лентах не больше INBOX_LIMIT последних записей.
+
+    Без user_ids обрезаются все ленты. Возвращает число удалённых записей.
+    """
+    condition, params = '', []
+    if user_ids is not None:
+        if not user_ids:
+            return 0
+        condition = 'WHERE user_id IN ({})'.format(
+            ', '.join(['%s'] * len(user_ids)))
+        params = list(user_ids)
+    feed_table = FeedEntry._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            DELETE FROM {feed_table} WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (
+                        PARTITION BY user_id
+                        ORDER BY pub_date DESC, post_id DESC
+                    ) AS position
+                    FROM {feed_table} {condition}
+                ) WHERE position > %s
+            )
+        ''', [*params, INBOX_LIMIT])
+        return cursor.rowcount
+
+
+def rebuild():
+    """Заново собирает все ленты одним запросом.
+
+    Нужна после массовой загрузки постов и подписок, которая не
+    вызывает сигналы. Возвращает число записей в лентах.
+    """
+    cache.delete(POPULAR_AUTHORS_KEY)
+    popular = popular_authors()
+    exclude = ''
+    if popular:
+        exclude = 'WHERE f.author_id NOT IN ({})'.format(
+            ', '.join(str(int(author_id)) for author_id in popular))
+    feed_table = FeedEntry._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {feed_table}')
+        cursor.execute(f'''
+            INSERT INTO {feed_table} (user_id, post_id, author_id, pub_date)
+            SELECT f.user_id, p.id, p.author_id, p.pub_date
+            FROM {Follow._meta.db_table} f
+            JOIN (
+                SELECT id, author_id, pub_date, ROW_NUMBER() OVER (
+                    PARTITION BY author_id ORDER BY pub_date DESC
+                ) AS position
+                FROM {Post._meta.db_table}
+            ) p ON p.author_id = f.author_id AND p.position <= %s
+            {exclude}
+        ''', [BACKFILL_LIMIT])
+        created = cursor.rowcount
+        return created - cap()
@@ -0,0 +1,143 @@
+from django.db import connection
+
+from core.cache import bump
+
+from . import counters, feed
+from .graph import graph
+from .models import Follow, User
+
+# Авторов в одном INSERT: SQLite ограничивает число параметров запроса.
+FOLLOW_BATCH: int = 400
+
+FOLLOW_TABLE = Follow._meta.db_table
+USER_TABLE = User._meta.db_table
+
+
+def followed(user_id, author_ids, usernames):
+    """Побочные эффекты новых подписок: ленты, счётчики и кеш."""
+    if len(author_ids) == 1:
+        feed.backfill(user_id, author_ids[0])
+        counters.change_author(author_ids[0], followers_count=1)
+    else:
+        feed.backfill_many(user_id, author_ids)
+        counters.change_authors(author_ids, followers_count=1)
+    feed.cap([user_id])
+    counters.change_author(user_id, following_count=len(author_ids))
+    graph.followed(user_id, author_ids)
+    bump(*(f'author:{username}' for username in usernames))
+
+
+def unfollowed(user_id, author_id, usernames):
+    """Побочные эффекты отписки."""
+    feed.trim(user_id, author_id)
+    counters.change_author(author_id, followers_count=-1)
+    counters.change_author(user_id, following_count=-1)
+    graph.unfollowed(user_id, author_id)
+    bump(*(f'author:{username}' for username in usernames))
+
+
+def follow(user, username):
+    """Подписывает пользователя на автора одним запросом.
+
+    Повторная подписка и подписка на себя ничего не делают. Возвращает
+    id автора, если подписка появилась, иначе None.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            INSERT INTO {FOLLOW_TABLE} (user_id, author_id)
+            SELECT %s, id FROM {USER_TABLE}
+            WHERE username = %s AND id != %s
+            ON CONFLICT DO NOTHING
+            RETURNING author_id
+        ''', [user.pk, username, user.pk])
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    followed(user.pk, [row[0]], (username, user.username))
+    return row[0]
+
+
+def unfollow(user, username):
+    """Отписывает пользователя от автора одним запросом.
+
+    Возвращает id автора, если подписка была, иначе None.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            DELETE FROM {FOLLOW_TABLE}
+            WHERE user_id = %s AND author_id = (
+                SELECT id FROM {USER_TABLE} WHERE username = %s)
+            RETURNING author_id
+        ''', [user.pk, username])
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    unfollowed(user.pk, row[0], (username, user.username))
+    return row[0]
+
+
+def follow_many(user, author_ids):
+    """Подписывает пользователя на многих авторов пачками.
+
+    Несуществующие id пропускаются. Возвращает множество id авторов,
+    на которых подписка появилась.
+    """
+    author_ids = sorted(
+        {int(author_id) for author_id in author_ids} - {user.pk})
+    created = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(author_ids), FOLLOW_BATCH):
+            batch = author_ids[start:start + FOLLOW_BATCH]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f'''
+                INSERT INTO {FOLLOW_TABLE} (user_id, author_id)
+                SELECT %s, id FROM {USER_TABLE} WHERE id IN ({placeholders})
+                ON CONFLICT DO NOTHING
+                RETURNING author_id
+            ''', [user.pk, *batch])
+            created.extend(author_id for author_id, in cursor.fetchall())
+    if created:
+        usernames = User.objects.filter(
+            pk__in=created).values_list('username', flat=True)
+        followed(user.pk, created, (*usernames, user.username))
+    return set(created)
+
+
+def insert_pairs(pairs):
+    """Записывает подписки (user_id, author_id) пачками без побочных эффектов.
+
+    Для массовой загрузки: ленты, счётчики и граф после неё собираются
+    заново. Уже существующие подписки и подписки на себя пропускаются.
+    Возвращает число появившихся подписок.
+    """
+    pairs = sorted({(user_id, author_id) for user_id, author_id in pairs
+                    if user_id != author_id})
+    created = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(pairs), FOLLOW_BATCH):
+            batch = pairs[start:start + FOLLOW_BATCH]
+            values = ', '.join(['(%s, %s)'] * len(batch))
+            cursor.execute(f'''
+                INSERT INTO {FOLLOW_TABLE} (user_id, author_id)
+                VALUES {values}
+                ON CONFLICT DO NOTHING
+                RETURNING id
+            ''', [value for pair in batch for value in pair])
+            created += len(cursor.fetchall())
+    return created
+
+
+def followers_of(author_ids):
+    """Словарь id автора -> множество id подписчиков, одним запросом."""
+    followers = {author_id: set() for author_id in author_ids}
+    for author_id, user_id in Follow.objects.filter(
+            author_id__in=followers).values_list('author', 'user').iterator():
+        followers[author_id].add(user_id)
+    return followers
+
+
+def mutuals(user_id):
+    """Id пользователей, с которыми подписка взаимна."""
+    return set(Follow.objects.filter(
+        user_id=user_id, author__follower__author_id=user_id,
+    ).values_list('author', flat=True))
@@ -1,6 +1,25 @@
+from django.core.cache import cache
 from django.forms import ModelForm
+from django.utils.functional import SimpleLazyObject
 
-from .models import Post, Comment
+from core.cache import invalidation_timeout
+
+from .models import Group, Post, Comment
+
+GROUP_CHOICES_KEY = 'forms:group_choices'
+
+
+def group_choices():
+    """Варианты поля группы; сбрасываются сигналами модели Group.
+
+    Сигнал сбрасывает только кеш своего процесса, поэтому с кешем
+    процесса варианты ещё и устаревают со временем.
+    """
+    choices = cache.get(GROUP_CHOICES_KEY)
+    if choices is None:
+        choices = list(Group.objects.values_list('pk', 'title'))
+        cache.set(GROUP_CHOICES_KEY, choices, invalidation_timeout())
+    return choices
 
 
 class PostForm(ModelForm):
@@ -8,6 +27,17 @@ class PostForm(ModelForm):
         model = Post
         fields = ('text', 'group', 'image',)
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Список групп берётся из кеша, а не из запроса при рендеринге.
+        group = self.fields['group']
+        group.choices = [('', group.empty_label), *group_choices()]
+
+
+def lazy_post_form(request):
+    """PostForm, который создаётся, только если шаблон к нему обратится."""
+    return SimpleLazyObject(lambda: PostForm(request.POST or None))
+
 
 class CommentForm(ModelForm):
     class Meta:
@@ -0,0 +1,182 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from .models import Follow
+
+# Версия графа в общем кеше: по ней процессы узнают о чужих изменениях.
+VERSION_KEY = 'follow_graph:version'
+SUGGESTIONS_LIMIT: int = 5
+# Сколько подписок каждого друга просматривается при подборе, чтобы
+# популярные пользователи не делали подбор дорогим.
+SUGGESTIONS_FANOUT: int = 200
+# С кешем процесса (locmem) версия не общая: граф перечитывается
+# не реже чем раз в столько секунд.
+LOCAL_MAX_AGE: int = 60
+
+
+def _contains(authors, author_id):
+    position = bisect_left(authors, author_id)
+    return position < len(authors) and authors[position] == author_id
+
+
+class FollowGraph:
+    """Граф подписок в памяти процесса.
+
+    Подписки хранятся отсортированными массивами id авторов по id
+    подписчика; число подписчиков берётся из AuthorStats. Граф
+    обновляется сигналами подписок; изменения из других процессов
+    замечаются по версии в общем кеше, с кешем процесса граф
+    перечитывается раз в LOCAL_MAX_AGE секунд.
+
+    Граф перечитывается в фоновом потоке, запросы его не ждут: пока
+    граф устарел, is_following читает подписку из базы, а подбор
+    строится по прежнему графу. При TASKS_EAGER граф читается сразу.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.following = None
+        self.version = None
+        self.loaded_at = 0
+        self.loading = False
+
+    def _load(self, version):
+        following = {}
+        # Из основной базы: граф из отстающей реплики получил бы
+        # свежую версию и не перечитывался бы до следующей подписки.
+        # Порядок даёт уникальный индекс (user, author), поэтому
+        # массивы собираются уже отсортированными.
+        for user_id, author_id in Follow.objects.using('default').order_by(
+                'user', 'author').values_list('user', 'author').iterator():
+            authors = following.get(user_id)
+            if authors is None:
+                authors = following[user_id] = array('i')
+            authors.append(author_id)
+        with self.lock:
+            self.following = following
+            self.version = version
+            self.loaded_at = time.monotonic()
+
+    def _reload(self, version):
+        try:
+            self._load(version)
+        finally:
+            with self.lock:
+                self.loading = False
+
+    def _reload_in_background(self, version):
+        try:
+            self._reload(version)
+        finally:
+            connections.close_all()
+
+    def _current_version(self):
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, 0, None)
+            version = cache.get(VERSION_KEY)
+        return version
+
+    def _current(self, exact=True):
+        """Граф для чтения или None, если его нет или он устарел.
+
+        С exact=False годится и устаревший граф.
+        """
+        version = self._current_version()
+        with self.lock:
+            fresh = self.following is not None and version == self.version
+            reload = (not fresh or self._expired()) and not self.loading
+            if reload:
+                self.loading = True
+            following = self.following
+        if reload and settings.TASKS_EAGER:
+            self._reload(version)
+            return self.following
+        if reload:
+            threading.Thread(target=self._reload_in_background,
+                             args=(version,), daemon=True,
+                             name='follow-graph').start()
+        return following if fresh or not exact else None
+
+    def _expired(self):
+        return (not settings.CACHE_SHARED
+                and time.monotonic() - self.loaded_at > LOCAL_MAX_AGE)
+
+    def _bump(self):
+        try:
+            return cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.add(VERSION_KEY, 0, None)
+            return cache.incr(VERSION_KEY)
+
+    def _change(self, user_id, author_ids, delta):
+        version = self._bump()
+        with self.lock:
+            # Пропущено чужое изменение: граф нужно перечитать.
+            if self.version is None or version != self.version + 1:
+                self.version = None
+                return
+            # Копия: подбор может читать прежний массив без блокировки.
+            authors = array('i', self.following.get(user_id, ()))
+            # Граф мог загрузиться уже после записи в базу, и изменение
+            # в нём уже есть: применять его второй раз нельзя.
+            if any(_contains(authors, author_id) == (delta > 0)
+                   for author_id in author_ids):
+                self.version = None
+                return
+            for author_id in author_ids:
+                if delta > 0:
+                    insort(authors, author_id)
+                else:
+                    authors.pop(bisect_left(authors, author_id))
+            self.following[user_id] = authors
+            self.version = version
+
+    def followed(self, user_id, author_ids):
+        self._change(user_id, author_ids, 1)
+
+    def unfollowed(self, user_id, author_id):
+        self._change(user_id, [author_id], -1)
+
+    def invalidate(self):
+        """Заставляет все процессы перечитать граф.
+
+        Нужна после массовой загрузки подписок, которая не вызывает
+        сигналы.
+        """
+        self._bump()
+        with self.lock:
+            self.version = None
+
+    def is_following(self, user_id, author_id):
+        following = self._current()
+        if following is None:
+            return Follow.objects.using('default').filter(
+                user_id=user_id, author_id=author_id).exists()
+        return _contains(following.get(user_id, ()), author_id)
+
+    def suggestions(self, user_id, limit=SUGGESTIONS_LIMIT):
+        """Друзья друзей, на которых пользователь ещё не подписан.
+
+        Возвращает id, отсортированные по числу общих подписок.
+        """
+        following = self._current(exact=False)
+        if following is None:
+            return []
+        mine = following.get(user_id, ())
+        votes = Counter()
+        for friend_id in mine:
+            votes.update(following.get(friend_id, ())[:SUGGESTIONS_FANOUT])
+        for excluded in (*mine, user_id):
+            votes.pop(excluded, None)
+        return [candidate for candidate, _ in votes.most_common(limit)]
+
+
+graph = FollowGraph()
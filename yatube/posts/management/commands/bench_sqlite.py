@@ -0,0 +1,145 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from core.db import backup, pragma_statements
+from posts.management.commands.bench_views import percentile
+from posts.models import Comment, Post
+from posts.utils import LAST_POSTS
+
+LISTING_SQL = (f'SELECT id, text, pub_date, author_id, group_id '
+               f'FROM {Post._meta.db_table} '
+               f'ORDER BY pub_date DESC, id DESC LIMIT {LAST_POSTS}')
+COMMENT_SQL = (f'INSERT INTO {Comment._meta.db_table} '
+               f'(text, created, author_id, post_id) VALUES (?, ?, ?, ?)')
+
+
+class Worker(threading.Thread):
+    """Читает ленту или пишет комментарии до окончания замера.
+
+    При CONN_MAX_AGE = 0 соединение открывается на каждую операцию,
+    как у Django с одним соединением на запрос.
+    """
+
+    def __init__(self, path, profile, deadline, write, targets, seed):
+        super().__init__()
+        self.path = path
+        self.pragmas = pragma_statements(profile['PRAGMAS'])
+        self.reuse = profile['CONN_MAX_AGE'] != 0
+        self.deadline = deadline
+        self.write = write
+        self.targets = targets
+        self.random = random.Random(seed)
+        self.operations = 0
+        self.locked = 0
+        self.latencies = []
+
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        for statement in self.pragmas:
+            db.execute(statement)
+        return db
+
+    def operate(self, db):
+        if self.write:
+            post_id, author_id = self.random.choice(self.targets)
+            db.execute(COMMENT_SQL, ('Замер', timezone.now().isoformat(),
+                                     author_id, post_id))
+            db.commit()
+        else:
+            db.execute(LISTING_SQL).fetchall()
+
+    def run(self):
+        db = self.connect() if self.reuse else None
+        while time.perf_counter() < self.deadline:
+            started = time.perf_counter()
+            current = db or self.connect()
+            try:
+                self.operate(current)
+            except sqlite3.OperationalError as error:
+                if 'locked' not in str(error):
+                    raise
+                current.rollback()
+                self.locked += 1
+            else:
+                self.operations += 1
+                self.latencies.append(time.perf_counter() - started)
+            finally:
+                if db is None:
+                    current.close()
+        if db is not None:
+            db.close()
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает профили SQLite из SQLITE_PROFILES: читатели ленты '
+            'и писатели комментариев работают одновременно на копии базы.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--profiles', nargs='+',
+                            choices=settings.SQLITE_PROFILES,
+                            default=list(settings.SQLITE_PROFILES))
+        parser.add_argument('--source',
+                            help='Файл базы, по умолчанию база проекта.')
+
+    def handle(self, *args, **options):
+        source = options['source'] or settings.DATABASES['default']['NAME']
+        if connection.vendor != 'sqlite' or not os.path.exists(source):
+            raise CommandError('Нужна файловая база SQLite.')
+        targets = list(Post.objects.values_list('pk', 'author')[:1000])
+        if not targets:
+            raise CommandError('В базе нет постов, запустите seed_data.')
+        self.stdout.write(
+            f'{"профиль":<8} {"чтений/с":>9} {"записей/с":>10} '
+            f'{"p95 чтения, мс":>15} {"p95 записи, мс":>15} '
+            f'{"locked":>7}')
+        with tempfile.TemporaryDirectory() as directory:
+            for name in options['profiles']:
+                path = os.path.join(directory, f'{name}.sqlite3')
+                backup(source, path)
+                self.measure(name, path, targets, options)
+
+    def measure(self, name, path, targets, options):
+        profile = settings.SQLITE_PROFILES[name]
+        db = sqlite3.connect(path)
+        for statement in pragma_statements(profile['PRAGMAS']):
+            db.execute(statement)
+        db.close()
+        deadline = time.perf_counter() + options['seconds']
+        workers = [
+            Worker(path, profile, deadline, write, targets, seed)
+            for seed, write in enumerate(
+                [False] * options['readers'] + [True] * options['writers'])
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        readers = [worker for worker in workers if not worker.write]
+        writers = [worker for worker in workers if worker.write]
+        self.stdout.write(
+            f'{name:<8} '
+            f'{self.rate(readers, options):>9.0f} '
+            f'{self.rate(writers, options):>10.0f} '
+            f'{self.p95(readers):>15.2f} {self.p95(writers):>15.2f} '
+            f'{sum(worker.locked for worker in workers):>7}')
+
+    def rate(self, workers, options):
+        return sum(worker.operations for worker in workers) / options[
+            'seconds']
+
+    def p95(self, workers):
+        latencies = [latency * 1000 for worker in workers
+                     for latency in worker.latencies]
+        return percentile(latencies, 95) or 0
@@ -0,0 +1,169 @@
+import json
+import math
+import random
+import subprocess
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import Follow, Group, Post, User
+from posts.warmup import visitor_client
+from posts.utils import LAST_POSTS
+
+VIEWS = ('index', 'index_deep', 'group_posts', 'profile', 'post_detail',
+         'follow_index')
+
+
+def percentile(values, percent):
+    """Процентиль по методу ближайшего ранга."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Измеряет задержку, число запросов к БД и размер ответа '
+            'представлений posts.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Запросов на каждое представление.')
+        parser.add_argument('--views', nargs='+', choices=VIEWS,
+                            default=VIEWS)
+        parser.add_argument('--warm', action='store_true',
+                            help='Не очищать кеш перед каждым запросом.')
+        parser.add_argument('--output', help='Сохранить результаты в JSON.')
+        parser.add_argument('--compare',
+                            help='JSON прошлого прогона для сравнения.')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Допустимый рост p95 при сравнении.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.load_targets()
+        results = {}
+        for view in options['views']:
+            if not self.has_targets(view):
+                self.stdout.write(f'{view:<14} пропущено: нет данных')
+                continue
+            results[view] = self.measure(
+                view, options['requests'], options['warm'])
+            self.report(view, results[view])
+        data = {
+            'revision': git_revision(),
+            'created': timezone.now().isoformat(),
+            'requests': options['requests'],
+            'warm': options['warm'],
+            'posts': Post.objects.count(),
+            'users': len(self.users),
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(data, output, indent=2, ensure_ascii=False)
+        if options['compare']:
+            self.compare(options['compare'], results, options['threshold'])
+
+    def load_targets(self):
+        self.users = list(User.objects.values_list('username', flat=True))
+        self.groups = list(Group.objects.values_list('slug', flat=True))
+        self.posts = list(Post.objects.values_list('pk', flat=True)[:10000])
+        self.followers = list(
+            Follow.objects.values_list('user', flat=True).distinct()[:1000])
+        self.pages = max(Post.objects.count() // LAST_POSTS, 1)
+        if not self.users or not self.posts:
+            raise CommandError('Нет данных: сначала запустите seed_data.')
+
+    def has_targets(self, view):
+        if view == 'group_posts':
+            return bool(self.groups)
+        if view == 'follow_index':
+            return bool(self.followers)
+        return True
+
+    def request(self, view):
+        client = visitor_client()
+        if view == 'index':
+            return client, reverse('posts:index'), {}
+        if view == 'index_deep':
+            return client, reverse('posts:index'), {
+                'page': self.random.randint(1, self.pages)}
+        if view == 'group_posts':
+            return client, reverse('posts:group_posts', kwargs={
+                'slug': self.random.choice(self.groups)}), {}
+        if view == 'profile':
+            return client, reverse('posts:profile', kwargs={
+                'username': self.random.choice(self.users)}), {}
+        if view == 'follow_index':
+            client.force_login(User.objects.get(
+                pk=self.random.choice(self.followers)))
+            return client, reverse('posts:follow_index'), {}
+        return client, reverse('posts:post_detail', kwargs={
+            'post_id': self.random.choice(self.posts)}), {}
+
+    def measure(self, view, requests, warm):
+        latencies, queries, sizes = [], [], []
+        for _ in range(requests):
+            client, url, params = self.request(view)
+            if not warm:
+                cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = client.get(url, params)
+                latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(
+                    f'{url} вернул {response.status_code}')
+            queries.append(len(context))
+            sizes.append(len(response.content))
+        return {
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'queries_max': max(queries),
+            'queries_mean': sum(queries) / len(queries),
+            'bytes_mean': sum(sizes) / len(sizes),
+        }
+
+    def report(self, view, result):
+        self.stdout.write(
+            f'{view:<14} p50 {result["p50_ms"]:8.2f} мс  '
+            f'p95 {result["p95_ms"]:8.2f} мс  '
+            f'p99 {result["p99_ms"]:8.2f} мс  '
+            f'запросов {result["queries_max"]:3}  '
+            f'{result["bytes_mean"]:9.0f} байт')
+
+    def compare(self, path, results, threshold):
+        with open(path) as previous_file:
+            previous = json.load(previous_file)['results']
+        regressions = []
+        for view, result in results.items():
+            before = previous.get(view)
+            if before is None:
+                continue
+            change = result['p95_ms'] / before['p95_ms'] - 1
+            self.stdout.write(
+                f'{view:<14} p95 {change:+.0%}, запросов '
+                f'{before["queries_max"]} -> {result["queries_max"]}')
+            if (change > threshold
+                    or result['queries_max'] > before['queries_max']):
+                regressions.append(view)
+        if regressions:
+            raise CommandError('Регрессия: ' + ', '.join(regressions))
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.bulk import dump_record, export_records
+
+
+class Command(BaseCommand):
+    help = ('Потоково выгружает пользователей, группы, посты, комментарии '
+            'и подписки в JSON Lines или в формат dumpdata.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('jsonl', 'json'),
+                            help='По умолчанию по расширению файла.')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        array = (options['format'] or (
+            'jsonl' if path.endswith('.jsonl') else 'json')) == 'json'
+        started = time.perf_counter()
+        count = 0
+        with open(path, 'w', encoding='utf-8') as output:
+            if array:
+                output.write('[')
+            for record in export_records(options['batch_size']):
+                if array:
+                    output.write(',\n' if count else '\n')
+                output.write(dump_record(record))
+                if not array:
+                    output.write('\n')
+                count += 1
+            if array:
+                output.write('\n]\n')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'Выгружено {count} записей за {elapsed:.1f} с, '
+            f'{count / max(elapsed, 1e-9):.0f} в секунду')
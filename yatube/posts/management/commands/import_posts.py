@@ -0,0 +1,113 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.db import analyze
+from posts import counters, feed
+from posts.bulk import IMPORT_ORDER, Importer, iter_records
+from posts.graph import graph
+
+# Как часто печатать скорость загрузки, в пачках.
+REPORT_EVERY: int = 20
+
+
+class Command(BaseCommand):
+    help = ('Потоково загружает пользователей, группы, посты, комментарии '
+            'и подписки из JSON Lines или выгрузки dumpdata.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл прогресса, по умолчанию <path>.progress.')
+        parser.add_argument('--resume', action='store_true',
+                            help='Продолжить с последней сохранённой пачки.')
+        parser.add_argument('--no-rebuild', action='store_true',
+                            help='Не пересобирать ленты и счётчики.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        checkpoint = options['checkpoint'] or f'{path}.progress'
+        skip, posts = 0, {}
+        if options['resume']:
+            skip, posts = self.read_checkpoint(checkpoint)
+        elif os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        importer = Importer(options['batch_size'], skip=skip, posts=posts)
+        if skip:
+            self.stdout.write(f'Продолжаем после {skip} записей')
+        self.started = time.perf_counter()
+        flushes = 0
+        try:
+            with open(path, encoding='utf-8') as stream:
+                for record in iter_records(stream):
+                    if not importer.add(record):
+                        continue
+                    self.write_checkpoint(checkpoint, importer)
+                    flushes += 1
+                    if flushes % REPORT_EVERY == 0:
+                        self.report_progress(importer.records)
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Не удалось прочитать {path}: {error}')
+        importer.flush()
+        self.write_checkpoint(checkpoint, importer)
+        if not options['no_rebuild']:
+            # Популярных авторов лента находит по пересчитанным счётчикам.
+            counters.recount()
+            feed.rebuild()
+        graph.invalidate()
+        analyze()
+        os.remove(checkpoint)
+        self.report(importer)
+
+    def read_checkpoint(self, checkpoint):
+        """Число загруженных записей и словарь старых id постов в новые."""
+        try:
+            with open(checkpoint) as progress:
+                lines = progress.read().splitlines()
+        except FileNotFoundError:
+            return 0, {}
+        records, posts = 0, {}
+        for number, line in enumerate(lines, 1):
+            try:
+                entry = json.loads(line)
+                records = entry['records']
+                posts.update(
+                    (int(old), new)
+                    for old, new in entry.get('posts', {}).items())
+            except (ValueError, KeyError, AttributeError):
+                # Последняя строка могла не дописаться при сбое.
+                if number == len(lines):
+                    break
+                raise CommandError(f'Повреждён файл прогресса {checkpoint}')
+        return records, posts
+
+    def write_checkpoint(self, checkpoint, importer):
+        # Файл только дописывается строками JSON: сбой может оборвать
+        # лишь последнюю строку, а словарь постов не переписывается
+        # целиком на каждой пачке.
+        with open(checkpoint, 'a') as progress:
+            progress.write(json.dumps({
+                'records': importer.records,
+                'posts': importer.flushed_posts,
+            }) + '\n')
+
+    def report_progress(self, records):
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(
+            f'{records} записей, {records / elapsed:.0f} в секунду')
+
+    def report(self, importer):
+        elapsed = time.perf_counter() - self.started
+        for label in IMPORT_ORDER:
+            self.stdout.write(
+                f'{label:<14} загружено {importer.created[label]:>9}  '
+                f'пропущено {importer.skipped[label]:>9}')
+        if importer.ignored:
+            self.stdout.write(f'Другие модели: {importer.ignored} записей')
+        self.stdout.write(
+            f'Готово: {importer.records} записей за {elapsed:.1f} с, '
+            f'{importer.records / max(elapsed, 1e-9):.0f} в секунду')
@@ -0,0 +1,150 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from faker import Faker
+
+from core.db import analyze
+from posts import counters, feed
+from posts.bulk import explicit_dates
+from posts.graph import graph
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими данными для нагрузочных тестов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=100_000)
+        parser.add_argument('--follows', type=int, default=50,
+                            help='Подписок на пользователя.')
+        parser.add_argument('--comments', type=int, default=2,
+                            help='Комментариев на пост в среднем.')
+        parser.add_argument('--days', type=int, default=365,
+                            help='За сколько дней распределить посты.')
+        # SQLite разрешает не больше 500 частей в составном SELECT,
+        # которым Django 2.2 делает массовую вставку.
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.faker = Faker('ru_RU')
+        self.faker.seed_instance(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = f'bench{int(time.time())}_'
+        started = time.perf_counter()
+        with transaction.atomic():
+            users = self.step('users', self.create_users, options['users'])
+            groups = self.step('groups', self.create_groups,
+                               options['groups'])
+            posts = self.step('posts', self.create_posts, options['posts'],
+                              users, groups, options['days'])
+            self.step('follows', self.create_follows, options['follows'],
+                      users)
+            self.step('comments', self.create_comments,
+                      options['comments'], users, posts)
+            self.step('counters', lambda: sum(counters.recount().values()))
+            self.step('feeds', feed.rebuild)
+        graph.invalidate()
+        analyze()
+        self.stdout.write(
+            f'Готово за {time.perf_counter() - started:.1f} с')
+
+    def step(self, name, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        count = len(result) if isinstance(result, list) else result
+        self.stdout.write(
+            f'{name}: {count} за {time.perf_counter() - started:.1f} с')
+        return result
+
+    def create_users(self, count):
+        User.objects.bulk_create(
+            (User(username=f'{self.prefix}{i}', password='!',
+                  first_name=self.faker.first_name(),
+                  last_name=self.faker.last_name())
+             for i in range(count)),
+            batch_size=self.batch_size,
+        )
+        return list(User.objects.filter(
+            username__startswith=self.prefix).values_list('pk', flat=True))
+
+    def create_groups(self, count):
+        Group.objects.bulk_create(
+            (Group(title=self.faker.sentence(nb_words=3)[:200],
+                   slug=f'{self.prefix}{i}'.replace('_', '-'),
+                   description=self.faker.paragraph())
+             for i in range(count)),
+            batch_size=self.batch_size,
+        )
+        return list(Group.objects.filter(
+            slug__startswith=self.prefix.replace('_', '-')
+        ).values_list('pk', flat=True))
+
+    def create_posts(self, count, users, groups, days):
+        now = timezone.now()
+        span = timedelta(days=days).total_seconds()
+        first_id = (Post.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0)
+        with explicit_dates(Post._meta.get_field('pub_date')):
+            Post.objects.bulk_create(
+                (Post(text=self.faker.text(max_nb_chars=400),
+                      author_id=self.random.choice(users),
+                      group_id=(self.random.choice(groups)
+                                if groups and self.random.random() < 0.7
+                                else None),
+                      pub_date=now - timedelta(
+                          seconds=self.random.random() * span))
+                 for _ in range(count)),
+                batch_size=self.batch_size,
+            )
+        return list(Post.objects.filter(pk__gt=first_id).values_list(
+            'pk', 'pub_date'))
+
+    def create_follows(self, per_user, users):
+        if len(users) < 2:
+            return 0
+        per_user = min(per_user, len(users) - 1)
+        # Степенное распределение: у немногих авторов много подписчиков.
+        weights = [1 / (rank + 1) for rank in range(len(users))]
+        pairs = set()
+        for user_id in users:
+            authors = set(self.random.choices(users, weights, k=per_user))
+            authors.discard(user_id)
+            pairs.update((user_id, author_id) for author_id in authors)
+        Follow.objects.bulk_create(
+            (Follow(user_id=user_id, author_id=author_id)
+             for user_id, author_id in pairs),
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+        return len(pairs)
+
+    def create_comments(self, per_post, users, posts):
+        if not per_post or not users:
+            return 0
+        total = 0
+
+        def comments():
+            nonlocal total
+            for post_id, pub_date in posts:
+                for _ in range(self.random.randint(0, per_post * 2)):
+                    total += 1
+                    yield Comment(
+                        text=self.faker.sentence(),
+                        author_id=self.random.choice(users),
+                        post_id=post_id,
+                        created=pub_date + timedelta(
+                            minutes=self.random.randint(1, 60 * 24)),
+                    )
+
+        with explicit_dates(Comment._meta.get_field('created')):
+            Comment.objects.bulk_create(comments(),
+                                        batch_size=self.batch_size)
+        return total
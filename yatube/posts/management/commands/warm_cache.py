@@ -0,0 +1,79 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import thumbnails, warmup
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Прогревает кеш страниц: главная, группы, популярные профили '
+            'и обсуждаемые посты.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int,
+                            default=max(settings.CACHE_WARMUP_PAGES, 1),
+                            help='Сколько страниц каждой ленты прогревать.')
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--authors', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Сколько страниц запрашивать параллельно.')
+        parser.add_argument('--thumbnails', action='store_true',
+                            help='Сначала создать недостающие миниатюры.')
+
+    def handle(self, *args, **options):
+        pages, workers = options['pages'], options['workers']
+        self.verbosity = options['verbosity']
+        started = time.perf_counter()
+        if options['thumbnails']:
+            self.generate_thumbnails(workers)
+        if not settings.CACHE_SHARED:
+            # Кеш процесса исчезнет вместе с командой: сайт его не увидит.
+            raise CommandError(
+                f'Кеш {settings.CACHE_BACKEND} не общий, прогревать его '
+                'из команды бесполезно. Задайте CACHE_BACKEND.')
+        sections = (
+            ('index', warmup.index_urls(pages)),
+            ('groups', warmup.group_urls(pages, options['groups'])),
+            ('profiles', warmup.author_urls(pages, options['authors'])),
+            ('posts', warmup.post_urls(options['posts'])),
+        )
+        total = 0
+        for name, urls in sections:
+            total += self.warm(name, urls, workers)
+        self.stdout.write(
+            f'Прогрето {total} страниц за '
+            f'{time.perf_counter() - started:.1f} с')
+
+    def generate_thumbnails(self, workers):
+        started = time.perf_counter()
+        post_ids = list(Post.objects.exclude(image='').filter(
+            thumbnail='').values_list('pk', flat=True))
+        warmup.parallel_map(thumbnails.generate, post_ids, workers)
+        self.stdout.write(
+            f'миниатюры: {len(post_ids)} за '
+            f'{time.perf_counter() - started:.1f} с')
+
+    def warm(self, name, urls, workers):
+        started = time.perf_counter()
+        results = warmup.warm_urls(urls, workers)
+        if not results:
+            self.stdout.write(f'{name:<9} нет страниц')
+            return 0
+        timings = [ms for _, (_, ms) in results]
+        failed = [(url, status) for url, (status, _) in results
+                  if status != 200]
+        if self.verbosity >= 2:
+            for url, (status, ms) in results:
+                self.stdout.write(f'  {status} {ms:8.1f} мс  {url}')
+        self.stdout.write(
+            f'{name:<9} {len(results):5} страниц за '
+            f'{time.perf_counter() - started:6.1f} с  '
+            f'медиана {statistics.median(timings):7.1f} мс  '
+            f'максимум {max(timings):7.1f} мс')
+        for url, status in failed:
+            self.stderr.write(f'  {url} вернул {status}')
+        return len(results)
@@ -0,0 +1,59 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:40
+
+from django.db import migrations
+from django.db.utils import OperationalError
+
+CREATE_TABLE = (
+    "CREATE VIRTUAL TABLE posts_post_fts USING fts5("
+    "text, content='posts_post', content_rowid='id', tokenize='{}')"
+)
+TRIGGERS = (
+    "CREATE TRIGGER posts_post_fts_insert AFTER INSERT ON posts_post BEGIN "
+    "INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text); "
+    "END",
+    "CREATE TRIGGER posts_post_fts_delete AFTER DELETE ON posts_post BEGIN "
+    "INSERT INTO posts_post_fts(posts_post_fts, rowid, text) "
+    "VALUES ('delete', old.id, old.text); "
+    "END",
+    "CREATE TRIGGER posts_post_fts_update AFTER UPDATE OF text ON posts_post "
+    "BEGIN "
+    "INSERT INTO posts_post_fts(posts_post_fts, rowid, text) "
+    "VALUES ('delete', old.id, old.text); "
+    "INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text); "
+    "END",
+)
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(CREATE_TABLE.format('trigram'))
+    except OperationalError:
+        # SQLite до 3.34 не знает trigram: ищем по словам.
+        schema_editor.execute(
+            CREATE_TABLE.format('unicode61 remove_diacritics 2'))
+    for sql in TRIGGERS:
+        schema_editor.execute(sql)
+    schema_editor.execute(
+        "INSERT INTO posts_post_fts(posts_post_fts) VALUES ('rebuild')")
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for trigger in ('insert', 'delete', 'update'):
+        schema_editor.execute(
+            f'DROP TRIGGER IF EXISTS posts_post_fts_{trigger}')
+    schema_editor.execute('DROP TABLE IF EXISTS posts_post_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_post_thumbnail'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
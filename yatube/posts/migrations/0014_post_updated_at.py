@@ -0,0 +1,41 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:10
+
+import importlib
+
+import django.utils.timezone
+from django.db import migrations, models
+
+fts = importlib.import_module('posts.migrations.0012_post_fts')
+
+
+def create_triggers(apps, schema_editor):
+    # Добавление поля в SQLite пересоздаёт таблицу вместе с триггерами.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for trigger in ('insert', 'delete', 'update'):
+        schema_editor.execute(
+            f'DROP TRIGGER IF EXISTS posts_post_fts_{trigger}')
+    for sql in fts.TRIGGERS:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, create_triggers),
+        migrations.AddField(
+            model_name='post',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Дата изменения'),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(
+            'UPDATE posts_post SET updated_at = pub_date',
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunPython(create_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_of(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by()
+        .values(field).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def create_missing_stats(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Post = apps.get_model('posts', 'Post')
+    Follow = apps.get_model('posts', 'Follow')
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    missing = list(User.objects.filter(stats__isnull=True).values_list(
+        'pk', flat=True))
+    AuthorStats.objects.bulk_create(
+        (AuthorStats(user_id=user_id) for user_id in missing),
+        batch_size=500,
+    )
+    for start in range(0, len(missing), 500):
+        AuthorStats.objects.filter(
+            user_id__in=missing[start:start + 500]).update(
+            posts_count=count_of(Post.objects, 'author'),
+            followers_count=count_of(Follow.objects, 'author'),
+            following_count=count_of(Follow.objects, 'user'),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0016_feed_keyset_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_stats,
+                             migrations.RunPython.noop),
+    ]
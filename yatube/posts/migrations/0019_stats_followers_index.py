@@ -0,0 +1,17 @@
+# Generated by Django 2.2.16 on 2026-10-18 06:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_comment_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='authorstats',
+            index=models.Index(fields=['followers_count'], name='stats_followers_idx'),
+        ),
+    ]
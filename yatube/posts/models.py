@@ -4,23 +4,63 @@ from django.db import models
 User = get_user_model()
 
 
-class Group(models.Model):
+class CounterFieldsMixin:
+    """Не перезаписывает счётчики при сохранении загруженного объекта.
+
+    Счётчики меняются только через F()-выражения в posts.counters, а
+    поля, которые заполняют фоновые задачи, — только через update(),
+    иначе сохранение устаревшей копии затёрло бы чужие изменения.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class Group(CounterFieldsMixin, models.Model):
     title = models.CharField(verbose_name='Название группы',
                              max_length=200)
     slug = models.SlugField(verbose_name='Краткое название группы',
                             unique=True)
     description = models.TextField(verbose_name='Описание')
+    post_count = models.PositiveIntegerField(
+        verbose_name='Количество постов', default=0, editable=False)
+
+    counter_fields = ('post_count',)
 
     def __str__(self):
         return self.title
 
 
-class Post(models.Model):
+class PostQuerySet(models.QuerySet):
+    def for_listing(self):
+        """Посты для карточек в лентах: только то, что выводит карточка."""
+        return self.select_related('author', 'group').only(
+            'text', 'pub_date', 'updated_at', 'image', 'thumbnail',
+            'comment_count', 'author', 'group',
+            'author__username', 'author__first_name', 'author__last_name',
+            'group__slug', 'group__title',
+        )
+
+
+class Post(CounterFieldsMixin, models.Model):
     text = models.TextField(verbose_name='Текст поста',
                             help_text='Введите текст поста')
     pub_date = models.DateTimeField(verbose_name='Дата публикации',
                                     auto_now_add=True,
                                     db_index=True)
+    updated_at = models.DateTimeField(verbose_name='Дата изменения',
+                                      auto_now=True)
     author = models.ForeignKey(
         User,
         verbose_name='Автор',
@@ -41,11 +81,30 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True,
     )
+    thumbnail = models.CharField(
+        verbose_name='Миниатюра картинки',
+        max_length=255,
+        blank=True,
+        editable=False,
+    )
+    comment_count = models.PositiveIntegerField(
+        verbose_name='Количество комментариев', default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
+
+    # Адрес миниатюры пишет posts.thumbnails.generate.
+    counter_fields = ('comment_count', 'thumbnail')
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -68,6 +127,10 @@ class Comment(models.Model):
         ordering = ['-created']
         verbose_name_plural = 'Коментарии'
         verbose_name = 'Коментарий'
+        indexes = [
+            models.Index(fields=['post', '-created', '-id'],
+                         name='comment_post_created_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -87,3 +150,86 @@ class Follow(models.Model):
                 fields=['user', 'author'], name='unique_author_user_following'
             )
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
+
+
+class AuthorStats(models.Model):
+    user = models.OneToOneField(User, verbose_name='Автор',
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name='stats')
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Количество постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков', default=0)
+    following_count = models.PositiveIntegerField(
+        verbose_name='Количество подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Статистика автора'
+        verbose_name_plural = 'Статистика авторов'
+        indexes = [
+            models.Index(fields=['followers_count'],
+                         name='stats_followers_idx'),
+        ]
+
+    def __str__(self):
+        return str(self.user)
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(User, verbose_name='Подписчик',
+                             on_delete=models.CASCADE,
+                             related_name='feed')
+    post = models.ForeignKey(Post, verbose_name='Пост',
+                             on_delete=models.CASCADE,
+                             related_name='feed_entries')
+    author = models.ForeignKey(User, verbose_name='Автор',
+                               on_delete=models.CASCADE,
+                               related_name='+')
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        ordering = ['-pub_date']
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_feed_user_post'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='feed_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='feed_user_author_idx'),
+        ]
+
+
+class Notification(models.Model):
+    user = models.ForeignKey(User, verbose_name='Подписчик',
+                             on_delete=models.CASCADE,
+                             related_name='notifications')
+    post = models.ForeignKey(Post, verbose_name='Пост',
+                             on_delete=models.CASCADE,
+                             related_name='notifications')
+    created = models.DateTimeField(verbose_name='Дата создания',
+                                   auto_now_add=True)
+    sent = models.DateTimeField(verbose_name='Дата отправки',
+                                null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Уведомление'
+        verbose_name_plural = 'Уведомления'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_notification_user_post'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['sent', 'user'],
+                         name='notification_sent_user_idx'),
+        ]
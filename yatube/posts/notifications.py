@@ -0,0 +1,128 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.urls import reverse
+from django.utils import timezone
+
+from core.tasks import task
+
+from .models import Follow, Notification, Post
+
+# Сколько подписчиков записывается одним INSERT и сколько писем
+# отправляется через одно соединение с почтовым сервером.
+NOTIFY_BATCH: int = 500
+# Сколько постов перечисляется в одной сводке; остальные считаются.
+DIGEST_POSTS: int = 20
+PREVIEW_LENGTH: int = 200
+
+
+def post_url(post):
+    return settings.SITE_URL + reverse('posts:post_detail', args=(post.pk,))
+
+
+def author_name(post):
+    return post.author.get_full_name() or post.author.username
+
+
+def pending():
+    return Notification.objects.filter(sent__isnull=True).select_related(
+        'user', 'post__author').only(
+        'user__email', 'post__text', 'post__author__username',
+        'post__author__first_name', 'post__author__last_name')
+
+
+def send_batch(messages):
+    """Отправляет пачку писем через одно соединение."""
+    with get_connection() as connection:
+        connection.send_messages(messages)
+
+
+@task()
+def notify_followers(post_id):
+    """Записывает уведомления подписчикам автора о новом посте.
+
+    Подписчики читаются итератором и записываются пачками по
+    NOTIFY_BATCH, поэтому память не растёт с числом подписчиков.
+    Без сводки письма отправляются сразу, иначе — со следующей сводкой.
+    """
+    author_id = Post.objects.filter(pk=post_id).values_list(
+        'author', flat=True).first()
+    if author_id is None:
+        return
+    followers = Follow.objects.filter(author_id=author_id).exclude(
+        user__email='').values_list('user', flat=True)
+    batch = []
+    for user_id in followers.iterator(chunk_size=NOTIFY_BATCH):
+        batch.append(Notification(user_id=user_id, post_id=post_id))
+        if len(batch) == NOTIFY_BATCH:
+            Notification.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    Notification.objects.bulk_create(batch, ignore_conflicts=True)
+    if settings.NOTIFICATIONS_DIGEST:
+        schedule_digest()
+    else:
+        send_post(post_id)
+
+
+def send_post(post_id):
+    """Отправляет неотправленные уведомления о посте, письмо на каждое."""
+    notifications = pending().filter(post_id=post_id).order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(notifications.filter(pk__gt=last_pk)[:NOTIFY_BATCH])
+        if not batch:
+            return
+        send_batch([
+            EmailMessage(
+                f'Новый пост: {author_name(item.post)}',
+                f'{item.post.text[:PREVIEW_LENGTH]}\n\n{post_url(item.post)}',
+                to=[item.user.email])
+            for item in batch
+        ])
+        Notification.objects.filter(
+            pk__in=[item.pk for item in batch]).update(sent=timezone.now())
+        last_pk = batch[-1].pk
+
+
+def schedule_digest():
+    """Ставит сводку на начало следующего часа, если её ещё нет в очереди."""
+    run_at = timezone.now().replace(minute=0, second=0, microsecond=0)
+    send_digest.delay_once_until(run_at + timedelta(hours=1))
+
+
+def digest_message(email, notifications):
+    lines = [f'{author_name(item.post)}: '
+             f'{item.post.text[:PREVIEW_LENGTH]}\n{post_url(item.post)}'
+             for item in notifications[:DIGEST_POSTS]]
+    hidden = len(notifications) - DIGEST_POSTS
+    if hidden > 0:
+        lines.append(f'И ещё постов: {hidden}')
+    return EmailMessage(
+        f'Новые посты ваших авторов: {len(notifications)}',
+        '\n\n'.join(lines), to=[email])
+
+
+@task()
+def send_digest():
+    """Отправляет каждому подписчику одно письмо со всеми новыми постами.
+
+    Подписчики берутся пачками по NOTIFY_BATCH; уведомления, созданные
+    во время отправки, достаются следующей сводке.
+    """
+    started = timezone.now()
+    notifications = pending().filter(created__lte=started)
+    last_user = 0
+    while True:
+        users = list(notifications.filter(user_id__gt=last_user).order_by(
+            'user').values_list('user', flat=True).distinct()[:NOTIFY_BATCH])
+        if not users:
+            return
+        grouped = {}
+        for item in notifications.filter(user_id__in=users).order_by(
+                'post__pub_date', 'pk'):
+            grouped.setdefault(item.user_id, []).append(item)
+        send_batch([digest_message(items[0].user.email, items)
+                    for items in grouped.values()])
+        notifications.filter(user_id__in=users).update(sent=timezone.now())
+        last_user = users[-1]
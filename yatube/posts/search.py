@@ -0,0 +1,44 @@
+from django.db.models import CharField, FloatField
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'posts_post_fts'
+SEARCH_ORDERING = ('rank', '-pk')
+# Границы подсветки в сниппете; заменяются на <mark> после экранирования.
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+SNIPPET_TOKENS: int = 24
+
+
+def match_expression(text):
+    """Превращает строку поиска в запрос FTS5 из фраз-слов."""
+    terms = text.split()
+    return ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+
+def match_posts(queryset, text):
+    """Посты, найденные по полнотекстовому индексу."""
+    match = match_expression(text)
+    if not match:
+        return queryset.none()
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = posts_post.id',
+               f'{FTS_TABLE} MATCH %s'],
+        params=[match],
+    )
+
+
+def search_posts(queryset, text):
+    """Найденные посты с рангом BM25 и сниппетом.
+
+    Функции FTS5 нельзя вычислять в сгруппированном запросе, поэтому
+    такую выборку считают через подзапрос по pk.
+    """
+    return match_posts(queryset, text).annotate(
+        rank=RawSQL(f'bm25({FTS_TABLE})', (), output_field=FloatField()),
+        snippet=RawSQL(
+            f'snippet({FTS_TABLE}, 0, %s, %s, %s, %s)',
+            (HIGHLIGHT_START, HIGHLIGHT_END, '…', SNIPPET_TOKENS),
+            output_field=CharField(),
+        ),
+    )
@@ -0,0 +1,94 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from core.cache import bump
+
+from . import counters, feed, follows
+from .forms import GROUP_CHOICES_KEY
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+
+
+def group_scopes(*group_ids):
+    """Области страниц групп; страница группы знает только slug."""
+    group_ids = {group_id for group_id in group_ids if group_id}
+    if not group_ids:
+        return []
+    return [f'group:{slug}' for slug in Group.objects.filter(
+        pk__in=group_ids).values_list('slug', flat=True)]
+
+
+def post_scopes(post, *group_ids):
+    """Области страниц с постом; group_ids — прежние группы поста."""
+    return ['posts', f'post:{post.pk}', f'author:{post.author.username}',
+            *group_scopes(post.group_id, *group_ids)]
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    cache.delete(GROUP_CHOICES_KEY)
+    bump(f'group:{instance.slug}')
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.bulk_create([AuthorStats(user_id=instance.pk)],
+                                        ignore_conflicts=True)
+
+
+@receiver(post_init, sender=Post)
+def post_loaded(sender, instance, **kwargs):
+    if 'group_id' in instance.__dict__:
+        instance._saved_group_id = instance.group_id
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        feed.fan_out.delay(instance.pk)
+        counters.change_author(instance.author_id, posts_count=1)
+        counters.change_group(instance.group_id, 1)
+    saved_group_id = instance.__dict__.get(
+        '_saved_group_id', instance.group_id)
+    if not created and saved_group_id != instance.group_id:
+        counters.change_group(saved_group_id, -1)
+        counters.change_group(instance.group_id, 1)
+    instance._saved_group_id = instance.group_id
+    bump(*post_scopes(instance, saved_group_id))
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.change_author(instance.author_id, posts_count=-1)
+    counters.change_group(instance.group_id, -1)
+    bump(*post_scopes(instance))
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.change_post(instance.post_id, 1)
+    bump(*post_scopes(instance.post))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.change_post(instance.post_id, -1)
+    bump(*post_scopes(instance.post))
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    usernames = (instance.author.username, instance.user.username)
+    if created:
+        follows.followed(instance.user_id, [instance.author_id], usernames)
+    else:
+        bump(*(f'author:{username}' for username in usernames))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    follows.unfollowed(instance.user_id, instance.author_id,
+                       (instance.author.username, instance.user.username))
@@ -0,0 +1,42 @@
+from django import template
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+CARD_TEMPLATE = 'includes/article.html'
+# Имя автора не входит в ключ, поэтому карточки не живут вечно.
+CARD_TIMEOUT: int = 60 * 60 * 24
+
+
+def card_key(post):
+    """Ключ карточки меняется при каждом изменении поста.
+
+    Счётчик комментариев обновляется без save(), поэтому он в ключе.
+    """
+    return (f'card:{post.pk}:{post.updated_at.timestamp()}:'
+            f'{post.comment_count}')
+
+
+@register.simple_tag
+def post_cards(posts):
+    """Пары (пост, карточка) для страницы ленты.
+
+    Все карточки читаются из кеша одним get_many, рендерятся только
+    отсутствующие.
+    """
+    posts = list(posts)
+    keys = [card_key(post) for post in posts]
+    found = cache.get_many(keys)
+    rendered = {}
+    card_template = get_template(CARD_TEMPLATE)
+    cards = []
+    for post, key in zip(posts, keys):
+        card = found.get(key)
+        if card is None:
+            card = rendered[key] = card_template.render({'post': post})
+        cards.append((post, mark_safe(card)))
+    if rendered:
+        cache.set_many(rendered, CARD_TIMEOUT)
+    return cards
@@ -0,0 +1,92 @@
+import json
+
+from django.test import TestCase
+from django.urls import reverse
+
+from core.testing import assert_query_budget
+
+from ..models import Comment, Group, Post, User
+from ..utils import LAST_POSTS
+
+
+class FeedApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='author', first_name='Лев', last_name='Толстой')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        for i in range(LAST_POSTS + 2):
+            cls.post = Post.objects.create(
+                text=f'Пост {i}', author=cls.author, group=cls.group)
+
+    def get(self, url, **headers):
+        response = self.client.get(url, **headers)
+        assert_query_budget(response)
+        return response
+
+    def test_feeds(self):
+        urls = (
+            reverse('posts:api_index'),
+            reverse('posts:api_group_posts', args=('group',)),
+            reverse('posts:api_profile', args=('author',)),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.get(url)
+                self.assertEqual(response['Content-Type'],
+                                 'application/json; charset=utf-8')
+                data = json.loads(response.content)
+                self.assertEqual(len(data['results']), LAST_POSTS)
+                self.assertEqual(data['results'][0], {
+                    'id': self.post.pk,
+                    'text': self.post.text,
+                    'pub_date': self.post.pub_date.isoformat(),
+                    'author': 'author',
+                    'author_name': 'Лев Толстой',
+                    'group': 'group',
+                    'image': None,
+                    'comment_count': 0,
+                })
+                last = self.get(f'{url}?cursor={data["next_cursor"]}')
+                self.assertEqual(len(json.loads(last.content)['results']), 2)
+        data = json.loads(self.get(urls[1]).content)
+        self.assertEqual(data['group']['title'], 'Группа')
+
+    def test_not_found(self):
+        response = self.client.get(
+            reverse('posts:api_profile', args=('nobody',)))
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('detail', json.loads(response.content))
+
+    def test_not_modified(self):
+        url = reverse('posts:api_index')
+        response = self.get(url)
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        response = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        Comment.objects.create(text='Новый', author=self.author,
+                               post=self.post)
+        response = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_renames_invalidate_etag(self):
+        url = reverse('posts:api_index')
+        renames = (
+            (self.author, 'first_name', 'Николай'),
+            (self.author, 'username', 'writer'),
+            (self.group, 'slug', 'renamed'),
+        )
+        for obj, field, value in renames:
+            with self.subTest(field=field):
+                etag = self.get(url)['ETag']
+                setattr(obj, field, value)
+                obj.save()
+                response = self.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn(value, response.content.decode())
@@ -0,0 +1,214 @@
+import json
+import os
+import sqlite3
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from .. import feed
+from ..bulk import Importer, iter_records
+from ..management.commands.bench_views import VIEWS
+from ..models import (AuthorStats, Comment, FeedEntry, Follow, Group, Post,
+                      User)
+
+
+class BenchmarkCommandsTest(TestCase):
+    def test_seed_and_bench(self):
+        call_command('seed_data', users=20, groups=3, posts=60, follows=5,
+                     comments=1, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 60)
+        self.assertEqual(User.objects.count(), AuthorStats.objects.count())
+        follow = Follow.objects.first()
+        self.assertEqual(
+            FeedEntry.objects.filter(user=follow.user_id).count(),
+            Post.objects.filter(
+                author__following__user=follow.user_id).count())
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            call_command('bench_views', requests=3, output=output,
+                         stdout=StringIO())
+            with open(output) as result_file:
+                results = json.load(result_file)['results']
+            call_command('bench_views', requests=3, compare=output,
+                         threshold=100, stdout=StringIO())
+        self.assertEqual(set(results), set(VIEWS))
+        self.assertIn('p99_ms', results['post_detail'])
+        self.assertGreater(results['profile']['bytes_mean'], 0)
+
+
+class SQLiteFileCommandsTest(TransactionTestCase):
+    """Копия базы снимается вне транзакции теста."""
+
+    def copy_database(self, directory):
+        source = os.path.join(directory, 'source.sqlite3')
+        target = sqlite3.connect(source)
+        connection.connection.backup(target)
+        target.close()
+        return source
+
+    def test_bench_sqlite(self):
+        call_command('seed_data', users=5, groups=1, posts=20, follows=1,
+                     comments=0, stdout=StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            source = self.copy_database(directory)
+            output = StringIO()
+            call_command('bench_sqlite', source=source, seconds=0.2,
+                         readers=1, writers=1, stdout=output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines[1:]],
+                         list(settings.SQLITE_PROFILES))
+
+    def test_sync_replica(self):
+        Post.objects.create(text='Пост', author=User.objects.create_user(
+            username='author'))
+        with tempfile.TemporaryDirectory() as directory:
+            databases = {
+                'default': {**settings.DATABASES['default'],
+                            'NAME': self.copy_database(directory)},
+                'replica': {**settings.DATABASES['replica'],
+                            'NAME': os.path.join(directory, 'replica')},
+            }
+            with self.settings(DATABASES=databases):
+                call_command('sync_replica', stdout=StringIO())
+            replica = sqlite3.connect(databases['replica']['NAME'])
+            count, = replica.execute(
+                'SELECT COUNT(*) FROM posts_post').fetchone()
+            replica.close()
+        self.assertEqual(count, 1)
+
+
+class WarmCacheCommandTest(TestCase):
+    def test_refuses_process_cache(self):
+        with self.settings(CACHE_SHARED=False):
+            with self.assertRaises(CommandError):
+                call_command('warm_cache', stdout=StringIO())
+
+    @override_settings(CACHE_SHARED=True)
+    def test_warm_cache(self):
+        call_command('seed_data', users=10, groups=2, posts=40, follows=3,
+                     comments=1, stdout=StringIO())
+        cache.clear()
+        out = StringIO()
+        call_command('warm_cache', pages=2, authors=3, posts=5, workers=1,
+                     stdout=out)
+        self.assertIn('posts         5 страниц', out.getvalue())
+        author = User.objects.order_by(
+            '-stats__followers_count', '-stats__posts_count').first()
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': author.username}))
+        self.assertEqual(response.wsgi_request.query_stats.count, 0)
+
+
+class ImportExportCommandsTest(TestCase):
+    dump = os.path.join(settings.BASE_DIR, 'dump.json')
+
+    def import_posts(self, path, **options):
+        call_command('import_posts', path, stdout=StringIO(), **options)
+
+    def test_import_dump(self):
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, 'progress')
+            self.import_posts(self.dump, batch_size=10,
+                              checkpoint=checkpoint)
+            self.assertEqual(Post.objects.count(), 37)
+            self.assertEqual(Group.objects.count(), 3)
+            post = Post.objects.get(pub_date__date='1854-03-14')
+            self.assertEqual(post.group.slug, 'RuLang')
+            self.assertEqual(AuthorStats.objects.get(user=post.author)
+                             .posts_count, post.author.posts.count())
+            self.assertFalse(os.path.exists(checkpoint))
+
+    def test_import_into_non_empty_database(self):
+        author = User.objects.create_user(username='local')
+        local = Post.objects.bulk_create(
+            Post(text=f'Локальный пост {number}', author=author)
+            for number in range(40))
+        Comment.objects.create(text='Локальный', author=author,
+                               post=Post.objects.order_by('pk').first())
+        with tempfile.TemporaryDirectory() as directory:
+            self.import_posts(self.dump, batch_size=10,
+                              checkpoint=os.path.join(directory, 'progress'))
+        self.assertEqual(Post.objects.count(), len(local) + 37)
+        self.assertFalse(Comment.objects.filter(
+            post__author=author).exclude(text='Локальный').exists())
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, 'progress')
+            with open(checkpoint, 'w') as progress:
+                json.dump({'records': 140}, progress)
+            self.import_posts(self.dump, checkpoint=checkpoint, resume=True)
+        self.assertEqual(Post.objects.count(), 10)
+        self.assertEqual(User.objects.count(), 3)
+
+    def test_resume_maps_comments_to_loaded_posts(self):
+        call_command('seed_data', users=4, groups=1, posts=12, follows=1,
+                     comments=2, stdout=StringIO())
+        comments = sorted(Comment.objects.values_list('text', 'post__text'))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'dump.jsonl')
+            call_command('export_posts', path, stdout=StringIO())
+            with open(path) as stream:
+                lines = stream.readlines()
+            head = os.path.join(directory, 'head.jsonl')
+            with open(head, 'w') as stream:
+                stream.writelines(
+                    line for line in lines if '"posts.comment"' not in line
+                    and '"posts.follow"' not in line)
+            checkpoint = os.path.join(directory, 'progress')
+            User.objects.all().delete()
+            Group.objects.all().delete()
+            # Сбой после загрузки постов: файл прогресса остаётся.
+            with mock.patch.object(feed, 'rebuild', side_effect=OSError):
+                with self.assertRaises(OSError):
+                    self.import_posts(head, batch_size=5,
+                                      checkpoint=checkpoint)
+            self.import_posts(path, batch_size=5, checkpoint=checkpoint,
+                              resume=True)
+        self.assertEqual(Post.objects.count(), 12)
+        self.assertEqual(comments, sorted(
+            Comment.objects.values_list('text', 'post__text')))
+
+    def test_export_import_round_trip(self):
+        call_command('seed_data', users=8, groups=2, posts=30, follows=3,
+                     comments=1, stdout=StringIO())
+        before = {
+            model: model.objects.count()
+            for model in (User, Group, Post, Comment, Follow)
+        }
+        texts = list(Post.objects.order_by('pk').values_list(
+            'text', 'author__username', 'group__slug'))
+        comments = sorted(Comment.objects.values_list(
+            'text', 'author__username', 'post__text'))
+        for name in ('dump.jsonl', 'dump.json'):
+            with self.subTest(name=name), \
+                    tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, name)
+                call_command('export_posts', path, batch_size=7,
+                             stdout=StringIO())
+                User.objects.all().delete()
+                Group.objects.all().delete()
+                self.import_posts(path, batch_size=16)
+                self.assertEqual(before, {
+                    model: model.objects.count() for model in before})
+                self.assertEqual(texts, list(
+                    Post.objects.order_by('pk').values_list(
+                        'text', 'author__username', 'group__slug')))
+                self.assertEqual(comments, sorted(Comment.objects.values_list(
+                    'text', 'author__username', 'post__text')))
+                with open(path) as stream:
+                    importer = Importer(batch_size=1000)
+                    for record in iter_records(stream):
+                        if record['model'] in ('auth.user', 'posts.follow'):
+                            importer.add(record)
+                    importer.flush()
+                self.assertEqual(importer.created['posts.follow'], 0)
+                self.assertEqual(importer.skipped['posts.follow'],
+                                 before[Follow])
@@ -0,0 +1,100 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import AuthorStats, Comment, Follow, Group, Post, User
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Заголовок',
+            slug='test-slug',
+            description='Описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other-slug',
+            description='Описание',
+        )
+
+    def stats(self, user):
+        return AuthorStats.objects.get(user=user)
+
+    def test_post_counters(self):
+        post = Post.objects.create(text='Пост', author=self.author,
+                                   group=self.group)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.post_count, 1)
+        post.group = self.other_group
+        post.save()
+        self.group.refresh_from_db()
+        self.other_group.refresh_from_db()
+        self.assertEqual(self.group.post_count, 0)
+        self.assertEqual(self.other_group.post_count, 1)
+        post.delete()
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+
+    def test_comment_counter(self):
+        post = Post.objects.create(text='Пост', author=self.author)
+        comment = Comment.objects.create(text='Комментарий',
+                                         author=self.reader, post=post)
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+
+    def test_stale_save_keeps_counter(self):
+        post = Post.objects.create(text='Пост', author=self.author)
+        Comment.objects.create(text='Комментарий', author=self.reader,
+                               post=post)
+        post.text = 'Исправленный пост'
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+
+    def test_follow_counters(self):
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        follow.delete()
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_recount_repairs_drift(self):
+        Post.objects.bulk_create(
+            Post(text='Пост', author=self.author, group=self.group)
+            for _ in range(3))
+        AuthorStats.objects.filter(user=self.author).delete()
+        out = StringIO()
+        call_command('recount_stats', stdout=out)
+        self.assertIn('groups: исправлено 1', out.getvalue())
+        self.assertEqual(self.stats(self.author).posts_count, 3)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.post_count, 3)
+
+    def test_stats_created_with_user(self):
+        newcomer = User.objects.create_user(username='newcomer')
+        self.assertEqual(self.stats(newcomer).posts_count, 0)
+        url = reverse('posts:profile', args=(newcomer.username,))
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as queries:
+                response = Client().get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                [query['sql'] for query in queries
+                 if not query['sql'].startswith('SELECT')], [])
+            # Строки нет у пользователей из массовой загрузки.
+            AuthorStats.objects.filter(user=newcomer).delete()
+            cache.clear()
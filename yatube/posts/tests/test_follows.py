@@ -0,0 +1,203 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from .. import follows
+from .. import graph as graph_module
+from ..graph import VERSION_KEY, graph
+from ..models import AuthorStats, FeedEntry, Follow, Post, User
+
+
+class FollowServiceTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [User.objects.create_user(username=f'author{number}')
+                       for number in range(3)]
+        for author in cls.authors:
+            Post.objects.create(text=f'Пост {author}', author=author)
+
+    def stats(self, user):
+        return AuthorStats.objects.get(user=user)
+
+    def test_follow_single_statement(self):
+        author = self.authors[0]
+        self.assertEqual(follows.follow(self.reader, author.username),
+                         author.pk)
+        with self.assertNumQueries(1):
+            self.assertIsNone(follows.follow(self.reader, author.username))
+        self.assertIsNone(follows.follow(self.reader, self.reader.username))
+        self.assertIsNone(follows.follow(self.reader, 'nobody'))
+        self.assertEqual(Follow.objects.filter(user=self.reader).count(), 1)
+        self.assertEqual(self.stats(author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.reader, author=author).exists())
+
+    def test_unfollow(self):
+        author = self.authors[0]
+        follows.follow(self.reader, author.username)
+        self.assertEqual(follows.unfollow(self.reader, author.username),
+                         author.pk)
+        with self.assertNumQueries(1):
+            self.assertIsNone(follows.unfollow(self.reader, author.username))
+        self.assertFalse(Follow.objects.exists())
+        self.assertFalse(FeedEntry.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.stats(author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_follow_many(self):
+        Follow.objects.create(user=self.reader, author=self.authors[0])
+        ids = [author.pk for author in self.authors]
+        created = follows.follow_many(
+            self.reader, ids + [self.reader.pk, 10 ** 6])
+        self.assertEqual(created, set(ids[1:]))
+        self.assertEqual(follows.follow_many(self.reader, ids), set())
+        self.assertEqual(self.stats(self.reader).following_count, 3)
+        for author in self.authors:
+            self.assertEqual(self.stats(author).followers_count, 1)
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.reader).count(), 3)
+
+    def test_insert_pairs(self):
+        first, second, _ = self.authors
+        Follow.objects.bulk_create([Follow(user=self.reader, author=first)])
+        pairs = [(self.reader.pk, first.pk), (self.reader.pk, second.pk),
+                 (self.reader.pk, second.pk), (first.pk, first.pk)]
+        self.assertEqual(follows.insert_pairs(pairs), 1)
+        self.assertEqual(follows.insert_pairs(pairs), 0)
+        self.assertEqual(Follow.objects.count(), 2)
+
+    def test_followers_and_mutuals(self):
+        first, second, third = self.authors
+        follows.follow_many(self.reader, [first.pk, second.pk])
+        follows.follow(first, self.reader.username)
+        follows.follow(third, first.username)
+        with self.assertNumQueries(1):
+            followers = follows.followers_of([first.pk, second.pk, third.pk])
+        self.assertEqual(followers, {
+            first.pk: {self.reader.pk, third.pk},
+            second.pk: {self.reader.pk},
+            third.pk: set(),
+        })
+        self.assertEqual(follows.mutuals(self.reader.pk), {first.pk})
+
+    def test_views_use_service(self):
+        client = Client()
+        client.force_login(self.reader)
+        author = self.authors[0]
+        response = client.get(reverse('posts:profile_follow',
+                                      args=(author.username,)))
+        self.assertRedirects(response, reverse('posts:profile',
+                                               args=(author.username,)))
+        self.assertTrue(Follow.objects.filter(
+            user=self.reader, author=author).exists())
+        client.get(reverse('posts:profile_unfollow', args=(author.username,)))
+        self.assertFalse(Follow.objects.exists())
+        response = client.get(reverse('posts:profile_follow',
+                                      args=('nobody',)))
+        self.assertEqual(response.status_code, 404)
+
+
+class FollowGraphTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [User.objects.create_user(username=f'author{number}')
+                       for number in range(4)]
+
+    def setUp(self):
+        graph.invalidate()
+
+    def test_updated_by_signals_and_service(self):
+        first, second = self.authors[:2]
+        self.assertFalse(graph.is_following(self.reader.pk, first.pk))
+        follow = Follow.objects.create(user=self.reader, author=first)
+        follows.follow(self.reader, second.username)
+        with self.assertNumQueries(0):
+            self.assertTrue(graph.is_following(self.reader.pk, first.pk))
+            self.assertTrue(graph.is_following(self.reader.pk, second.pk))
+            self.assertFalse(graph.is_following(first.pk, self.reader.pk))
+        follow.delete()
+        follows.unfollow(self.reader, second.username)
+        with self.assertNumQueries(0):
+            self.assertFalse(graph.is_following(self.reader.pk, first.pk))
+            self.assertFalse(graph.is_following(self.reader.pk, second.pk))
+
+    def test_change_already_loaded(self):
+        first, second = self.authors[:2]
+        Follow.objects.bulk_create([Follow(user=self.reader, author=first)])
+        self.assertTrue(graph.is_following(self.reader.pk, first.pk))
+        # Граф загружен после записи: сигнал не применяется повторно,
+        # а заставляет перечитать граф.
+        graph.followed(self.reader.pk, [first.pk, second.pk])
+        self.assertIsNone(graph.version)
+        self.assertTrue(graph.is_following(self.reader.pk, first.pk))
+        self.assertFalse(graph.is_following(self.reader.pk, second.pk))
+        # То же для отписки, которой в загруженном графе уже нет.
+        graph.unfollowed(self.reader.pk, second.pk)
+        self.assertIsNone(graph.version)
+        self.assertTrue(graph.is_following(self.reader.pk, first.pk))
+
+    @override_settings(TASKS_EAGER=False)
+    def test_stale_graph_reloads_in_background(self):
+        first, second = self.authors[:2]
+        Follow.objects.bulk_create([Follow(user=self.reader, author=first)])
+        with mock.patch.object(graph_module.threading, 'Thread') as thread:
+            # Пока граф перечитывается, ответ берётся из базы.
+            with self.assertNumQueries(1):
+                self.assertTrue(graph.is_following(self.reader.pk, first.pk))
+            self.assertFalse(graph.is_following(self.reader.pk, second.pk))
+            self.assertEqual(graph.suggestions(self.reader.pk), [])
+        thread.assert_called_once()
+        graph._reload(*thread.call_args[1]['args'])
+        with self.assertNumQueries(0):
+            self.assertTrue(graph.is_following(self.reader.pk, first.pk))
+        self.assertEqual(graph.following[self.reader.pk].typecode, 'i')
+
+    def test_reloads_after_foreign_change(self):
+        first = self.authors[0]
+        self.assertFalse(graph.is_following(self.reader.pk, first.pk))
+        Follow.objects.bulk_create([Follow(user=self.reader, author=first)])
+        cache.incr(VERSION_KEY)
+        self.assertTrue(graph.is_following(self.reader.pk, first.pk))
+
+    @override_settings(CACHE_SHARED=False)
+    def test_reloads_periodically_with_process_cache(self):
+        first = self.authors[0]
+        self.assertFalse(graph.is_following(self.reader.pk, first.pk))
+        Follow.objects.bulk_create([Follow(user=self.reader, author=first)])
+        self.assertFalse(graph.is_following(self.reader.pk, first.pk))
+        with mock.patch.object(graph_module, 'LOCAL_MAX_AGE', -1):
+            self.assertTrue(graph.is_following(self.reader.pk, first.pk))
+
+    def test_suggestions(self):
+        first, second, third, fourth = self.authors
+        self.assertEqual(graph.suggestions(self.reader.pk), [])
+        follows.follow_many(self.reader, [first.pk, second.pk])
+        follows.follow_many(first, [third.pk, self.reader.pk])
+        follows.follow_many(second, [third.pk, fourth.pk, first.pk])
+        with self.assertNumQueries(0):
+            self.assertEqual(graph.suggestions(self.reader.pk),
+                             [third.pk, fourth.pk])
+            self.assertEqual(graph.suggestions(self.reader.pk, limit=1),
+                             [third.pk])
+
+    def test_views(self):
+        first, second, third = self.authors[:3]
+        follows.follow(self.reader, first.username)
+        follows.follow(first, third.username)
+        client = Client()
+        client.force_login(self.reader)
+        response = client.get(reverse('posts:profile',
+                                      args=(second.username,)))
+        self.assertFalse(response.context['following'])
+        response = client.get(reverse('posts:profile',
+                                      args=(first.username,)))
+        self.assertTrue(response.context['following'])
+        response = client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['suggestions']), [third])
@@ -2,18 +2,22 @@ import shutil
 import tempfile
 from http import HTTPStatus
 
+from unittest import mock
+
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 
 from django.urls import reverse
 
+from ..forms import GROUP_CHOICES_KEY, PostForm, group_choices
 from ..models import Post, Group, User, Comment
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, TASKS_EAGER=True)
 class FormTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -113,6 +117,38 @@ class FormTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.check_data_post(form_data)
 
+    def test_create_post_thumbnail(self):
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с картинкой', 'image': self.uploaded},
+        )
+        post = Post.objects.latest('id')
+        self.assertTrue(post.thumbnail.startswith(settings.MEDIA_URL))
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.id}))
+        self.assertContains(response, post.thumbnail)
+
+    def test_edit_post_without_image_keeps_thumbnail(self):
+        post = Post.objects.create(text='Пост', author=self.user,
+                                   thumbnail='/media/cache/old.gif')
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.id}),
+            data={'text': 'Измененный текст'},
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.thumbnail, '/media/cache/old.gif')
+
+    def test_stale_save_keeps_generated_thumbnail(self):
+        post = Post.objects.create(text='Пост', author=self.user)
+        stale = Post.objects.get(pk=post.pk)
+        Post.objects.filter(pk=post.pk).update(
+            thumbnail='/media/cache/new.gif')
+        stale.text = 'Измененный текст'
+        stale.save()
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Измененный текст')
+        self.assertEqual(post.thumbnail, '/media/cache/new.gif')
+
 
 class TestCommentForm(TestCase):
     @classmethod
@@ -155,3 +191,55 @@ class TestCommentForm(TestCase):
             text='Текст комментария',
             post=self.post.pk,
             author=self.user).exists())
+
+
+class LazyPostFormTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='user')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        cls.post = Post.objects.create(text='Пост', author=cls.user,
+                                       group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_listings_do_not_build_post_form(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.user.username,)),
+            reverse('posts:post_detail', args=(self.post.pk,)),
+        )
+        with mock.patch.object(PostForm, '__init__',
+                               side_effect=AssertionError):
+            for url in urls:
+                with self.subTest(url=url):
+                    self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_group_choices_cached(self):
+        url = reverse('posts:post_edit', args=(self.post.pk,))
+        self.client.get(url)
+        # Сессия, пользователь и пост; группы берутся из кеша.
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertContains(response, 'Группа</option>')
+        self.group.title = 'Новое название'
+        self.group.save()
+        response = self.client.get(url)
+        self.assertContains(response, 'Новое название</option>')
+        self.assertContains(response, 'selected>Новое название')
+
+    def test_group_choices_expire_with_process_cache(self):
+        for shared, timeout in ((True, None),
+                                (False, settings.VIEW_CACHE_TIMEOUT)):
+            with self.subTest(shared=shared), \
+                    override_settings(CACHE_SHARED=shared), \
+                    mock.patch.object(cache, 'set') as cache_set:
+                cache.clear()
+                group_choices()
+                cache_set.assert_called_once_with(
+                    GROUP_CHOICES_KEY, mock.ANY, timeout)
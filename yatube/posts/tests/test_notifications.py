@@ -0,0 +1,66 @@
+from unittest import mock
+
+from django.core import mail
+from django.core.mail import get_connection
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import Task
+from core.tasks import drain
+
+from .. import notifications
+from ..models import Follow, Notification, Post, User
+
+
+class NotificationsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.readers = [
+            User.objects.create_user(username=f'reader{number}',
+                                     email=f'reader{number}@ya.ru')
+            for number in range(3)
+        ]
+        silent = User.objects.create_user(username='silent')
+        for reader in [*cls.readers, silent]:
+            Follow.objects.create(user=reader, author=cls.author)
+
+    @mock.patch.object(notifications, 'NOTIFY_BATCH', 2)
+    def test_post_create_sends_in_batches(self):
+        client = Client()
+        client.force_login(self.author)
+        with mock.patch.object(notifications, 'get_connection',
+                               wraps=get_connection) as connections:
+            client.post(reverse('posts:post_create'), {'text': 'Новый пост'})
+        self.assertEqual(connections.call_count, 2)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         [reader.email for reader in self.readers])
+        self.assertIn('Новый пост', mail.outbox[0].body)
+        self.assertEqual(Notification.objects.count(), 3)
+        self.assertFalse(Notification.objects.filter(
+            sent__isnull=True).exists())
+
+    @override_settings(TASKS_EAGER=False, TASK_WORKERS=0,
+                       NOTIFICATIONS_DIGEST=True)
+    def test_hourly_digest(self):
+        posts = [Post.objects.create(text=f'Пост {number}', author=self.author)
+                 for number in range(2)]
+        for post in posts:
+            notifications.notify_followers.delay(post.pk)
+        drain()
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(Notification.objects.count(), 6)
+        digest = Task.objects.get(name=notifications.send_digest.task_name)
+        self.assertGreater(digest.run_at, timezone.now())
+        self.assertEqual(digest.run_at.minute, 0)
+        Task.objects.update(run_at=timezone.now())
+        drain()
+        self.assertEqual(len(mail.outbox), 3)
+        for message in mail.outbox:
+            self.assertIn('Пост 0', message.body)
+            self.assertIn('Пост 1', message.body)
+        self.assertFalse(Notification.objects.filter(
+            sent__isnull=True).exists())
+        self.assertFalse(Task.objects.exists())
@@ -0,0 +1,117 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.db import analyze
+
+from ..feed import FANOUT_LIMIT, FeedPaginator
+from ..models import AuthorStats, Comment, Follow, Group, Post, User
+from ..utils import COMMENTS_PER_PAGE, POST_ORDERING, table_estimate
+
+
+class QueryPlanTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Заголовок',
+            slug='test-slug',
+            description='Описание',
+        )
+        cls.post = Post.objects.create(text='Пост', author=cls.user,
+                                       group=cls.group)
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return ' | '.join(row[-1] for row in cursor.fetchall())
+
+    def assertUsesIndex(self, queryset, index):
+        plan = self.query_plan(queryset)
+        self.assertIn(index, plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_index_uses_pub_date_index(self):
+        plan = self.query_plan(
+            Post.objects.for_listing().order_by(*POST_ORDERING)[:11])
+        self.assertIn('posts_post_pub_date', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_profile_uses_author_index(self):
+        self.assertUsesIndex(
+            self.user.posts.for_listing().order_by(*POST_ORDERING)[:11],
+            'post_author_pub_date_idx')
+
+    def test_group_uses_group_index(self):
+        self.assertUsesIndex(
+            self.group.selected_posts.for_listing().order_by(
+                *POST_ORDERING)[:11],
+            'post_group_pub_date_idx')
+
+    def test_comments_use_post_index(self):
+        Comment.objects.bulk_create(
+            Comment(text='Комментарий', author=self.user, post=self.post)
+            for _ in range(COMMENTS_PER_PAGE + 1))
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        cursor = None
+        for _ in range(2):
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(
+                    url, {'cursor': cursor} if cursor else {})
+            sql, = [query['sql'] for query in queries
+                    if 'FROM "posts_comment"' in query['sql']]
+            with connection.cursor() as db:
+                db.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = ' | '.join(row[-1] for row in db.fetchall())
+            self.assertIn('comment_post_created_idx', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+            cursor = response.context['comments'].next_cursor
+
+    def test_popular_authors_use_followers_index(self):
+        self.assertUsesIndex(
+            AuthorStats.objects.filter(
+                followers_count__gt=FANOUT_LIMIT).values_list('user'),
+            'stats_followers_idx')
+
+    def test_feed_page_reads_one_index_range(self):
+        paginator = FeedPaginator(self.user, 10)
+        cursor = paginator.encode_cursor(
+            paginator.object_list.model(post_id=self.post.pk,
+                                        pub_date=self.post.pub_date),
+            'next', 2)
+        _, _, values = paginator.decode_cursor(cursor)
+        self.assertUsesIndex(
+            paginator.object_list.filter(
+                paginator.keyset_filter(values, True))[:11],
+            'feed_user_pub_date_idx')
+
+    def test_table_estimate_from_statistics(self):
+        cache.clear()
+        self.assertIsNone(table_estimate(Post))
+        analyze()
+        cache.clear()
+        self.assertEqual(table_estimate(Post), 1)
+
+    def test_following_uses_covering_index(self):
+        plan = self.query_plan(
+            Follow.objects.filter(user=self.user).values('author'))
+        self.assertIn('COVERING INDEX', plan)
+        plan = self.query_plan(
+            Follow.objects.filter(author=self.user).values('user'))
+        self.assertIn('COVERING INDEX follow_author_user_idx', plan)
+
+
+class SQLitePragmasTest(TestCase):
+    def test_pragmas_applied_on_connect(self):
+        pragmas = settings.SQLITE_PRAGMAS
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], pragmas['busy_timeout'])
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], pragmas['cache_size'])
@@ -0,0 +1,69 @@
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Post, User
+from ..search import search_posts
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(
+            text='Еще переходъ до Фокшанъ, во время котораго я ѣхалъ',
+            author=cls.user,
+        )
+        cls.other = Post.objects.create(
+            text='Совсем другой текст без совпадений',
+            author=cls.user,
+        )
+
+    def setUp(self):
+        self.client = Client()
+
+    def search(self, text):
+        return list(search_posts(Post.objects.all(), text))
+
+    def test_search_russian_text(self):
+        self.assertEqual(self.search('фокшанъ'), [self.post])
+        self.assertEqual(self.search('ПЕРЕХОДЪ время'), [self.post])
+        self.assertEqual(self.search('"'), [])
+        self.assertEqual(self.search(''), [])
+
+    def test_index_follows_post_changes(self):
+        self.other.text = 'Теперь и здесь есть Фокшаны'
+        self.other.save()
+        self.assertEqual(len(self.search('фокшан')), 2)
+        self.other.delete()
+        self.assertEqual(self.search('фокшан'), [self.post])
+
+    def test_search_view_highlight(self):
+        Post.objects.create(text='Фокшаны <script>', author=self.user)
+        response = self.client.get(reverse('posts:search'), {'q': 'фокша'})
+        self.assertEqual(len(response.context['page_obj']), 2)
+        self.assertContains(response, '<mark>Фокша</mark>')
+        self.assertContains(response, '&lt;script&gt;')
+
+    def test_search_pages_keep_query(self):
+        Post.objects.bulk_create(
+            Post(text=f'Фокшаны {i}', author=self.user) for i in range(12))
+        url = reverse('posts:search')
+        first_page = self.client.get(url, {'q': 'фокша'})
+        page_obj = first_page.context['page_obj']
+        self.assertContains(
+            first_page, '?q=%D1%84%D0%BE%D0%BA%D1%88%D0%B0&amp;cursor=')
+        second_page = self.client.get(
+            url, {'q': 'фокша', 'cursor': page_obj.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(len(second_page), 3)
+        self.assertFalse(set(page_obj) & set(second_page))
+
+    def test_admin_search(self):
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'фокшанъ'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [self.post])
@@ -0,0 +1,151 @@
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core import mail
+from django.core.management import call_command
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import reverse
+from django.utils import timezone
+
+from core import tasks
+from core.models import Task
+from core.tasks import claim, drain, task
+
+from ..models import FeedEntry, Follow, Post, User
+
+calls = []
+
+
+@task(max_attempts=2)
+def remember(value, fail=False):
+    calls.append(value)
+    if fail:
+        raise ValueError(value)
+
+
+@task()
+def wait_for_heartbeat():
+    queued = Task.objects.get(name=wait_for_heartbeat.task_name)
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        if Task.objects.get(pk=queued.pk).locked_until > queued.locked_until:
+            calls.append('аренда продлена')
+            return
+        time.sleep(0.01)
+
+
+@override_settings(TASKS_EAGER=False, TASK_WORKERS=0)
+class TaskHeartbeatTest(TransactionTestCase):
+    """Аренду продлевает отдельный поток, ему нужны видимые строки."""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_running_task_extends_lease(self):
+        wait_for_heartbeat.delay()
+        with mock.patch.object(tasks, 'HEARTBEAT_SECONDS', 0.05):
+            self.assertTrue(tasks.run(claim()))
+        self.assertEqual(calls, ['аренда продлена'])
+
+
+@override_settings(TASKS_EAGER=False, TASK_WORKERS=0)
+class TaskQueueTest(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_and_drain(self):
+        queued = remember.delay('первая')
+        remember.delay('вторая')
+        self.assertEqual(queued.name, remember.task_name)
+        self.assertEqual(calls, [])
+        self.assertEqual(drain(), 2)
+        self.assertEqual(calls, ['первая', 'вторая'])
+        self.assertFalse(Task.objects.exists())
+
+    @override_settings(TASKS_EAGER=True)
+    def test_eager(self):
+        self.assertIsNone(remember.delay('сразу'))
+        self.assertIsNone(remember.delay('ошибка', fail=True))
+        self.assertEqual(calls, ['сразу', 'ошибка'])
+        self.assertFalse(Task.objects.exists())
+
+    def test_retry_then_fail(self):
+        queued = remember.delay('ошибка', fail=True)
+        self.assertEqual(drain(), 1)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Task.PENDING)
+        self.assertEqual(queued.attempts, 1)
+        self.assertGreater(queued.run_at, timezone.now())
+        self.assertIn('ValueError', queued.last_error)
+        self.assertEqual(drain(), 0)
+        Task.objects.update(run_at=timezone.now())
+        self.assertEqual(drain(), 1)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Task.FAILED)
+        self.assertEqual(calls, ['ошибка', 'ошибка'])
+
+    def test_expired_lease_is_reclaimed(self):
+        queued = remember.delay('забытая')
+        Task.objects.update(status=Task.RUNNING,
+                            locked_until=timezone.now() + timedelta(hours=1))
+        self.assertIsNone(claim())
+        Task.objects.update(locked_until=timezone.now() - timedelta(hours=1))
+        self.assertEqual(claim().pk, queued.pk)
+        self.assertIsNone(claim())
+
+    def test_lost_last_attempt_fails(self):
+        queued = remember.delay('падает с обработчиком')
+        Task.objects.update(status=Task.RUNNING, attempts=2,
+                            locked_until=timezone.now() - timedelta(hours=1))
+        self.assertIsNone(claim())
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Task.FAILED)
+        self.assertIsNone(queued.locked_until)
+        self.assertEqual(queued.attempts, 2)
+        self.assertEqual(calls, [])
+
+    def test_run_worker_once(self):
+        remember.delay('из команды')
+        output = StringIO()
+        call_command('run_worker', once=True, stdout=output)
+        self.assertIn('1', output.getvalue())
+        self.assertEqual(calls, ['из команды'])
+
+    def test_feed_fan_out_is_queued(self):
+        reader = User.objects.create_user(username='reader')
+        author = User.objects.create_user(username='author')
+        Follow.objects.create(user=reader, author=author)
+        post = Post.objects.create(text='Новый пост', author=author)
+        self.assertFalse(FeedEntry.objects.filter(post=post).exists())
+        drain()
+        self.assertTrue(FeedEntry.objects.filter(
+            user=reader, post=post).exists())
+
+
+class PasswordResetMailTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        User.objects.create_user(username='reader', email='reader@ya.ru',
+                                 password='secret-password')
+
+    def reset(self):
+        return Client().post(reverse('users:password_reset'),
+                             {'email': 'reader@ya.ru'})
+
+    def test_sent_immediately_when_eager(self):
+        self.reset()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['reader@ya.ru'])
+
+    @override_settings(TASKS_EAGER=False, TASK_WORKERS=0)
+    def test_sent_by_worker(self):
+        response = self.reset()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(drain(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('reader', mail.outbox[0].body)
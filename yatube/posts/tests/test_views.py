@@ -1,14 +1,31 @@
+import os
+import re
 import shutil
+import sqlite3
 import tempfile
+from io import StringIO
 
 from django import forms
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.core.management import call_command
+from unittest import mock
+
+from django.db import connection, connections
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.core.cache import cache
 
-from ..models import Post, Group, User, Follow
+from core.cache import bump
+from core.middleware import PRIMARY_COOKIE
+from core.testing import assert_query_budget
+
+from .. import feed, follows, warmup
+from ..graph import graph
+from ..models import Comment, FeedEntry, Post, Group, User, Follow
+from ..utils import COMMENTS_PER_PAGE, LAST_POSTS, page_window
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -64,6 +81,7 @@ class PagesTest(TestCase):
                 group=self.group,
                 author=self.user))
         Post.objects.bulk_create(post_count)
+        call_command('recount_stats', stdout=StringIO())
 
     def check_post(self, first_object):
         with self.subTest(first_object=first_object):
@@ -137,14 +155,29 @@ class PagesTest(TestCase):
             author=self.user)
         content_add = self.authorized_client.get(
             reverse('posts:index')).content
+        cached = self.authorized_client.get(reverse('posts:index'))
+        self.assertIsNone(cached.context)
+        self.assertEqual(content_add, cached.content)
         post.delete()
         content_delete = self.authorized_client.get(
             reverse('posts:index')).content
-        self.assertEqual(content_add, content_delete)
-        cache.clear()
-        content_cache_clear = self.authorized_client.get(
-            reverse('posts:index')).content
-        self.assertNotEqual(content_add, content_cache_clear)
+        self.assertNotEqual(content_add, content_delete)
+
+    def test_cache_comment_invalidates_post_detail(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        self.guest.get(url)
+        Comment.objects.create(text='Свежий комментарий',
+                               author=self.user, post=self.post)
+        response = self.guest.get(url)
+        self.assertIsNotNone(response.context)
+
+    def test_cache_is_per_viewer(self):
+        url = reverse('posts:profile',
+                      kwargs={'username': self.user.username})
+        self.authorized_client.get(url)
+        response = self.guest.get(url)
+        self.assertIsNotNone(response.context)
+        self.assertEqual(response.context['user'].is_authenticated, False)
 
 
 class TestPaginator(TestCase):
@@ -190,6 +223,73 @@ class TestPaginator(TestCase):
                     rev + '?page=2').context['page_obj']),
                 second_page_posts)
 
+    def test_cursor_pages(self):
+        url = reverse('posts:index')
+        first_page = self.guest_client.get(url).context['page_obj']
+        self.assertFalse(first_page.has_previous())
+        with self.assertNumQueries(1):
+            second_page = self.guest_client.get(
+                url, {'cursor': first_page.next_cursor}
+            ).context['page_obj']
+        self.assertEqual(len(second_page), 3)
+        self.assertEqual(second_page.number, 2)
+        self.assertFalse(second_page.has_next())
+        self.assertFalse(
+            set(first_page.object_list) & set(second_page.object_list))
+        back_page = self.guest_client.get(
+            url, {'cursor': second_page.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(back_page), list(first_page))
+        self.assertFalse(back_page.has_previous())
+
+    def test_page_window(self):
+        self.assertEqual(page_window(1, 1), [1])
+        self.assertEqual(page_window(10, 20), [1, None, 9, 10, 11, None, 20])
+        self.assertEqual(page_window(2, 7), [1, 2, 3, None, 7])
+
+    def test_last_page_from_counter(self):
+        Post.objects.bulk_create(
+            Post(text='Тестовый пост', group=self.group, author=self.user)
+            for _ in range(20))
+        # bulk_create не обновляет счётчик: задаём его сами.
+        Group.objects.filter(pk=self.group.pk).update(post_count=33)
+        url = reverse('posts:group_posts', kwargs={'slug': self.group.slug})
+        with CaptureQueriesContext(connection) as queries:
+            page = self.guest_client.get(url).context['page_obj']
+        self.assertFalse([query for query in queries
+                          if 'COUNT(' in query['sql']])
+        self.assertEqual(page.page_window,
+                         [(1, None), (2, page.next_cursor), (None, None),
+                          (4, page.last_cursor)])
+        last = self.guest_client.get(
+            url, {'cursor': page.last_cursor}).context['page_obj']
+        self.assertEqual(last.number, 4)
+        self.assertEqual(len(last), 3)
+        self.assertFalse(last.has_next())
+        previous = self.guest_client.get(
+            url, {'cursor': last.previous_cursor}).context['page_obj']
+        self.assertEqual(previous.number, 3)
+        self.assertEqual(len(previous), 10)
+
+    def test_page_number_links_use_cursors(self):
+        url = reverse('posts:index')
+        response = self.guest_client.get(url, {'page': 2})
+        self.assertEqual(len(response.context['page_obj']), 3)
+        self.assertNotContains(response, 'page=')
+
+    def test_page_number_out_of_range(self):
+        url = reverse('posts:index')
+        for number in ('99', '9' * 23, '²'):
+            with self.subTest(number=number):
+                response = self.guest_client.get(url, {'page': number})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context['page_obj'].number, 1)
+
+    def test_invalid_cursor(self):
+        response = self.guest_client.get(
+            reverse('posts:index'), {'cursor': 'garbage'})
+        self.assertEqual(len(response.context['page_obj']), 10)
+
 
 class FollowTest(TestCase):
     @classmethod
@@ -207,6 +307,7 @@ class FollowTest(TestCase):
         self.authorized_client.force_login(self.authorized)
         self.author_client = Client()
         self.author_client.force_login(self.author)
+        cache.clear()
 
     def test_follow_author(self):
         response = self.authorized_client.get(reverse("posts:follow_index"))
@@ -244,3 +345,443 @@ class FollowTest(TestCase):
         response = self.authorized_client.post(
             reverse('posts:follow_index'))
         self.assertIn(self.post, response.context['page_obj'].object_list)
+
+    def test_new_post_fan_out(self):
+        Follow.objects.create(author=self.author, user=self.authorized)
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.authorized, post=new_post).exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertIn(new_post, response.context['page_obj'].object_list)
+
+    def test_unfollow_trims_feed(self):
+        follow = Follow.objects.create(author=self.author,
+                                       user=self.authorized)
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.authorized, post=self.post).exists())
+        follow.delete()
+        self.assertFalse(FeedEntry.objects.filter(
+            user=self.authorized).exists())
+
+    def test_popular_author_pulled_on_read(self):
+        Follow.objects.create(author=self.author, user=self.authorized)
+        with mock.patch.object(feed, 'FANOUT_LIMIT', 0):
+            new_post = Post.objects.create(text='Популярный пост',
+                                           author=self.author)
+            self.assertFalse(FeedEntry.objects.filter(
+                post=new_post).exists())
+            response = self.authorized_client.get(
+                reverse('posts:follow_index'))
+        posts = response.context['page_obj'].object_list
+        self.assertIn(new_post, posts)
+        self.assertEqual(len(posts), 2)
+
+    def test_feed_pages_merge_pulled_authors(self):
+        popular = User.objects.create_user(username='popular')
+        Follow.objects.create(author=self.author, user=self.authorized)
+        Follow.objects.create(author=popular, user=self.authorized)
+        with mock.patch.object(feed, 'FANOUT_LIMIT', 0):
+            pulled = [Post.objects.create(text=f'Популярный {number}',
+                                          author=popular)
+                      for number in range(LAST_POSTS)]
+        own = [Post.objects.create(text=f'Пост {number}', author=self.author)
+               for number in range(LAST_POSTS)]
+        expected = sorted([self.post, *pulled, *own],
+                          key=lambda post: (post.pub_date, post.pk),
+                          reverse=True)
+        url = reverse('posts:follow_index')
+        with mock.patch.object(feed, 'FANOUT_LIMIT', 0):
+            cache.delete(feed.POPULAR_AUTHORS_KEY)
+            posts, cursor = [], None
+            while True:
+                page = self.authorized_client.get(
+                    url, {'cursor': cursor} if cursor else {}
+                ).context['page_obj']
+                posts += page.object_list
+                cursor = page.next_cursor
+                if cursor is None:
+                    break
+        self.assertEqual(posts, expected)
+
+    def test_inbox_capped(self):
+        with mock.patch.object(feed, 'INBOX_LIMIT', 3):
+            Follow.objects.create(author=self.author, user=self.authorized)
+            posts = [Post.objects.create(text=f'Пост {number}',
+                                         author=self.author)
+                     for number in range(4)]
+        self.assertEqual(
+            set(FeedEntry.objects.filter(user=self.authorized).values_list(
+                'post', flat=True)),
+            {post.pk for post in posts[1:]})
+
+    def test_fan_out_caps_only_its_followers(self):
+        User.objects.create_user(username='other')
+        Follow.objects.create(author=self.author, user=self.authorized)
+        with mock.patch.object(feed, 'cap', wraps=feed.cap) as cap:
+            Post.objects.create(text='Новый пост', author=self.author)
+        cap.assert_called_once_with([self.authorized.pk])
+
+
+class ListingQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Заголовок',
+            slug='test-slug',
+            description='Описание',
+        )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def add_posts(self, count):
+        for i in range(count):
+            author = User.objects.create_user(
+                username=f'author_{User.objects.count()}')
+            group = Group.objects.create(
+                title=f'Группа {i}', slug=f'group-{author.pk}',
+                description='Описание')
+            Follow.objects.create(user=self.reader, author=author)
+            post = Post.objects.create(text='Пост', author=author,
+                                       group=group)
+            Comment.objects.create(text='Комментарий', author=author,
+                                   post=post)
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        return len(context)
+
+    def test_listing_queries_do_not_grow(self):
+        urls = (reverse('posts:index'), reverse('posts:follow_index'))
+        self.add_posts(2)
+        before = [self.count_queries(url) for url in urls]
+        self.add_posts(8)
+        after = [self.count_queries(url) for url in urls]
+        self.assertEqual(before, after)
+
+    def test_listing_comment_count(self):
+        self.add_posts(1)
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.context['page_obj'][0].comment_count, 1)
+
+
+class QueryBudgetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(LAST_POSTS + 1):
+            post = Post.objects.create(text=f'Пост {i}', author=cls.author,
+                                       group=cls.group)
+            Comment.objects.create(text='Комментарий', author=cls.reader,
+                                   post=post)
+        cls.post = post
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def test_views_within_budget(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': 'group'}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+            reverse('posts:search') + '?q=Пост',
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                assert_query_budget(self.client.get(url))
+
+    def test_budget_exceeded(self):
+        response = self.client.get(reverse('posts:index'))
+        with self.assertRaises(AssertionError):
+            assert_query_budget(response, budget=0)
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="\d+ SQL", app;dur=[\d.]+$')
+
+
+@override_settings(REPLICA_ENABLED=True)
+class ReplicaRoutingTest(TransactionTestCase):
+    """Реплика в тестах — второе соединение с той же базой."""
+
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.post = Post.objects.create(text='Пост', author=self.author)
+        self.client.force_login(self.reader)
+
+    def get(self, url):
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(url)
+        return response, len(replica)
+
+    def test_listing_reads_from_replica(self):
+        response, replica_queries = self.get(reverse('posts:index'))
+        self.assertIn(self.post, response.context['page_obj'])
+        self.assertGreater(replica_queries, 0)
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+
+    def test_other_views_read_from_primary(self):
+        _, replica_queries = self.get(reverse('posts:search') + '?q=Пост')
+        self.assertEqual(replica_queries, 0)
+
+    def test_reads_stick_to_primary_after_write(self):
+        response, _ = self.get(reverse('posts:profile_follow',
+                                       args=(self.author.username,)))
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+        response, replica_queries = self.get(reverse('posts:follow_index'))
+        self.assertIn(self.post, response.context['page_obj'])
+        self.assertEqual(replica_queries, 0)
+
+
+@override_settings(REPLICA_ENABLED=True)
+class LaggingReplicaTest(TransactionTestCase):
+    """Реплика — отдельный файл, который не получает новых записей."""
+
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        graph.invalidate()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        Post.objects.create(text='Пост', author=self.author)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'replica.sqlite3')
+        target = sqlite3.connect(path)
+        connection.connection.backup(target)
+        target.close()
+        replica = connections['replica']
+        name = replica.settings_dict['NAME']
+        replica.close()
+        replica.settings_dict['NAME'] = path
+        self.addCleanup(replica.settings_dict.__setitem__, 'NAME', name)
+        self.addCleanup(replica.close)
+        self.client.force_login(self.reader)
+
+    def test_new_rows_missing_from_replica(self):
+        newcomer = User.objects.create_user(username='newcomer')
+        Post.objects.create(text='Новый пост', author=newcomer)
+        follows.follow(self.reader, self.author.username)
+        graph.invalidate()
+        self.assertFalse(User.objects.using('replica').filter(
+            username='newcomer').exists())
+        response = self.client.get(
+            reverse('posts:profile', args=('newcomer',)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['stats'].posts_count, 1)
+        response = self.client.get(
+            reverse('posts:profile', args=(self.author.username,)))
+        self.assertTrue(response.context['following'])
+
+
+class ConditionalViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        Post.objects.create(text='Пост', author=cls.author, group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_not_modified_without_rendering(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', args=('group',)),
+            reverse('posts:profile', args=('author',)),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn('Cookie', response['Vary'])
+                self.assertIn('public', response['Cache-Control'])
+                with self.assertNumQueries(0):
+                    response = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+                self.assertFalse(response.templates)
+
+    def test_if_modified_since(self):
+        url = reverse('posts:index')
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_invalidate_etag(self):
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+        Post.objects.create(text='Новый пост', author=self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_group_page_depends_only_on_its_group(self):
+        url = reverse('posts:group_posts', args=('group',))
+        other = Group.objects.create(title='Другая', slug='other',
+                                     description='Описание')
+
+        def etag_changed(change):
+            etag = self.client.get(url)['ETag']
+            change()
+            return self.client.get(url)['ETag'] != etag
+
+        post = Post.objects.create(text='Вне группы', author=self.author)
+        self.assertFalse(etag_changed(lambda: Post.objects.create(
+            text='Пост', author=self.author, group=other)))
+        self.assertTrue(etag_changed(lambda: Post.objects.create(
+            text='Пост', author=self.author, group=self.group)))
+        post.group = self.group
+        self.assertTrue(etag_changed(post.save))
+        post.group = other
+        self.assertTrue(etag_changed(post.save))
+
+    def test_authenticated_pages_are_private(self):
+        url = reverse('posts:index')
+        anonymous_etag = self.client.get(url)['ETag']
+        self.client.force_login(self.author)
+        response = self.client.get(url)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertNotEqual(response['ETag'], anonymous_etag)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=anonymous_etag)
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(CACHE_SHARED=False, VIEW_CACHE_TIMEOUT=60)
+    def test_process_cache_entries_expire(self):
+        with mock.patch.object(cache, 'add', wraps=cache.add) as add, \
+                mock.patch.object(cache, 'set', wraps=cache.set) as set_:
+            self.client.get(reverse('posts:index'))
+            bump('posts')
+        timeouts = {
+            kwargs.get('timeout', args[2:3] and args[2])
+            for args, kwargs in add.call_args_list + set_.call_args_list
+            if args[0].startswith(('generation:', 'view:'))
+        }
+        self.assertEqual(timeouts, {60})
+
+
+class WarmUpTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        author = User.objects.create_user(username='author')
+        group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        for i in range(LAST_POSTS * 2 + 1):
+            Post.objects.create(text=f'Пост {i}', author=author, group=group)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_listing_urls_follow_cursors(self):
+        urls = list(warmup.listing_urls(pages=5))
+        self.assertEqual(len(urls), 6)
+        response = self.client.get(reverse('posts:index'))
+        next_url = re.search(r'href="(\?cursor=[^"]+)"',
+                             response.content.decode()).group(1)
+        self.assertEqual(urls[1], reverse('posts:index') + next_url)
+
+    def test_warm_up_fills_cache(self):
+        self.assertEqual(warmup.warm_up(pages=2), 4)
+        for url in warmup.listing_urls(pages=2):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.wsgi_request.query_stats.count, 0)
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+        Post.objects.create(text='Другой пост', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def rendered_cards(self):
+        bump('posts')
+        response = self.client.get(reverse('posts:index'))
+        return [template.name for template in response.templates].count(
+            'includes/article.html')
+
+    def test_cards_rendered_once(self):
+        self.assertEqual(self.rendered_cards(), 2)
+        self.assertEqual(self.rendered_cards(), 0)
+
+    def test_card_changes_with_post(self):
+        self.rendered_cards()
+        self.post.text = 'Новый текст'
+        self.post.save()
+        self.assertEqual(self.rendered_cards(), 1)
+        Comment.objects.create(text='Комментарий', author=self.author,
+                               post=self.post)
+        self.assertEqual(self.rendered_cards(), 1)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Новый текст')
+        self.assertContains(response, 'Комментариев: 1')
+
+
+class PostCommentsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+        Comment.objects.bulk_create(
+            Comment(text=f'Комментарий {i}', author=cls.author,
+                    post=cls.post)
+            for i in range(COMMENTS_PER_PAGE + 5))
+        cls.url = reverse('posts:post_detail',
+                          kwargs={'post_id': cls.post.pk})
+
+    def setUp(self):
+        cache.clear()
+
+    def test_comments_paginated_by_cursor(self):
+        response = self.client.get(self.url)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENTS_PER_PAGE)
+        self.assertContains(response, 'Комментарий 24')
+        response = self.client.get(self.url, {'cursor': comments.next_cursor})
+        self.assertEqual(
+            [comment.text for comment in response.context['comments']],
+            [f'Комментарий {i}' for i in range(4, -1, -1)])
+
+    def test_comment_queries_do_not_grow(self):
+        post = Post.objects.create(text='Другой пост', author=self.author)
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        Comment.objects.create(text='Первый', author=self.author, post=post)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        assert_query_budget(response)
+        cache.clear()
+        Comment.objects.bulk_create(
+            Comment(text='Ещё', author=User.objects.create_user(
+                username=f'reader_{i}'), post=post)
+            for i in range(4))
+        with self.assertNumQueries(len(context)):
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['comments']), 5)
+        assert_query_budget(response)
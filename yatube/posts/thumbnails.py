@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.utils import timezone
+from sorl.thumbnail import get_thumbnail
+
+from core.cache import bump
+from core.tasks import task
+
+from .models import Post
+from .signals import post_scopes
+
+GEOMETRY = '960x339'
+OPTIONS = {'crop': 'center', 'upscale': True}
+
+
+@task()
+def generate(post_id):
+    """Создаёт миниатюру картинки поста и сохраняет её адрес в посте."""
+    post = Post.objects.select_related('author').only(
+        'image', 'group', 'author__username').filter(pk=post_id).first()
+    if post is None or not post.image:
+        return
+    thumbnail = get_thumbnail(post.image, GEOMETRY, **OPTIONS)
+    if Post.objects.filter(pk=post_id, image=post.image.name).update(
+            thumbnail=thumbnail.url, updated_at=timezone.now()):
+        bump(*post_scopes(post))
+
+
+def schedule(post):
+    """Сбрасывает миниатюру поста и ставит в очередь создание новой.
+
+    При TASKS_EAGER миниатюра создаётся сразу.
+    """
+    post.updated_at = timezone.now()
+    Post.objects.filter(pk=post.pk).update(thumbnail='',
+                                           updated_at=post.updated_at)
+    post.thumbnail = ''
+    if not post.image:
+        return
+    generate.delay(post.pk)
+    if settings.TASKS_EAGER:
+        post.refresh_from_db(fields=['thumbnail', 'updated_at'])
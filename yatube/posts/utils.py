@@ -1,10 +1,249 @@
-from django.core.paginator import Paginator
+import base64
+import json
+import math
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Page, Paginator
+from django.db import DatabaseError, connection
+from django.db.models import Q
 
 LAST_POSTS: int = 10
+COUNT_TIMEOUT: int = 60 * 5
+POST_ORDERING = ('-pub_date', '-pk')
+COMMENTS_PER_PAGE: int = 20
+COMMENT_ORDERING = ('-created', '-pk')
+# Наибольшее целое SQLite: OFFSET больше него не влезает в запрос.
+MAX_OFFSET: int = 2 ** 63 - 1
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+class CursorPaginator(Paginator):
+    """Постраничный вывод по ключу сортировки вместо OFFSET.
+
+    Каждая страница читается одним запросом по индексу независимо от
+    глубины, без COUNT. Номера страниц относительные: они переносятся
+    в курсоре и нужны только шаблону.
+    """
+
+    def __init__(self, object_list, per_page, ordering=POST_ORDERING):
+        super().__init__(object_list.order_by(*ordering), per_page)
+        self.ordering = ordering
+        self._has_next = False
+        self._page_length = 0
+        self._number = 1
+
+    @property
+    def num_pages(self):
+        return self._number + int(self._has_next)
+
+    @property
+    def count(self):
+        return (self._number - 1) * self.per_page + self._page_length
+
+    def encode_cursor(self, obj, direction, number):
+        values = [getattr(obj, name.lstrip('-')) for name in self.ordering]
+        data = json.dumps([direction, number, values], default=_isoformat)
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def encode_last(self, number, size):
+        """Курсор последней страницы из size объектов, читаемой с конца."""
+        data = json.dumps(['last', number, [size]])
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def ordering_field(self, name):
+        opts = self.object_list.model._meta
+        name = name.lstrip('-')
+        if name == 'pk':
+            return opts.pk
+        annotation = self.object_list.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return opts.get_field(name)
+
+    def decode_cursor(self, cursor):
+        try:
+            direction, number, values = json.loads(
+                base64.urlsafe_b64decode(cursor.encode()).decode())
+            if direction == 'last':
+                size, = values
+                if not isinstance(size, int):
+                    return None
+                values = [min(max(size, 1), self.per_page)]
+            else:
+                values = [
+                    self.ordering_field(name).to_python(value)
+                    for name, value in zip(self.ordering, values)
+                ]
+        except (ValueError, TypeError, ValidationError):
+            return None
+        if not isinstance(number, int):
+            return None
+        if direction not in ('next', 'prev', 'last'):
+            return None
+        if direction != 'last' and len(values) != len(self.ordering):
+            return None
+        return direction, max(number, 1), values
+
+    def keyset_filter(self, values, forward, ordering=None):
+        condition = Q()
+        equal = {}
+        for name, value in zip(ordering or self.ordering, values):
+            field = name.lstrip('-')
+            descending = name.startswith('-') == forward
+            lookup = f'{field}__{"lt" if descending else "gt"}'
+            condition |= Q(**equal, **{lookup: value})
+            equal[field] = value
+        return condition
+
+    def fetch(self, values, forward):
+        """Первые per_page + 1 объектов после ключа values в порядке обхода."""
+        queryset = self.object_list
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(values, forward))
+        if not forward:
+            queryset = queryset.reverse()
+        return list(queryset[:self.per_page + 1])
+
+    def load(self, object_list):
+        """Объекты страницы для шаблона; курсоры строятся по object_list."""
+        return object_list
+
+    def get_page(self, cursor):
+        decoded = self.decode_cursor(cursor) if cursor else None
+        if decoded is None:
+            return self.build_page('next', 1, self.fetch(None, True))
+        direction, number, values = decoded
+        if direction == 'last':
+            return self.build_page(direction, number,
+                                   self.fetch(None, False), values[0])
+        return self.build_page(direction, number,
+                               self.fetch(values, direction == 'next'))
+
+    def get_number_page(self, number):
+        """Страница по номеру из старых ссылок ?page=N.
+
+        Читается одним запросом с OFFSET без COUNT; ссылки с неё уже
+        ведут по курсорам.
+        """
+        offset = (number - 1) * self.per_page
+        if offset + self.per_page + 1 > MAX_OFFSET:
+            return self.get_page(None)
+        object_list = list(self.object_list[offset:offset + self.per_page + 1])
+        if not object_list and number > 1:
+            return self.get_page(None)
+        return self.build_page('next', number, object_list)
+
+    def build_page(self, direction, number, object_list, size=None):
+        """Страница из объектов, прочитанных в порядке обхода."""
+        size = size or self.per_page
+        has_more = len(object_list) > size
+        object_list = object_list[:size]
+        if direction == 'next':
+            self._has_next = has_more
+        else:
+            if direction == 'prev' and not has_more and len(
+                    object_list) < self.per_page:
+                return self.get_page(None)
+            object_list.reverse()
+            self._has_next = direction == 'prev'
+            if not has_more:
+                number = 1
+        self._number = number
+        self._page_length = len(object_list)
+        page = Page(object_list, number, self)
+        page.next_cursor = page.previous_cursor = None
+        if page.has_next():
+            page.next_cursor = self.encode_cursor(
+                object_list[-1], 'next', number + 1)
+        if page.has_previous() and object_list:
+            page.previous_cursor = self.encode_cursor(
+                object_list[0], 'prev', number - 1)
+        page.object_list = self.load(object_list)
+        return page
+
+    page = get_page
+
+
+def table_estimate(model):
+    """Приблизительное число строк таблицы из статистики ANALYZE.
+
+    Без статистики возвращает None: тогда последняя страница не
+    показывается, пока до неё не дойдут.
+    """
+    table = model._meta.db_table
+    key = f'paginator:estimate:{table}'
+    estimate = cache.get(key)
+    if estimate is None:
+        estimate = -1
+        if connection.vendor == 'sqlite':
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT stat FROM sqlite_stat1 '
+                                   'WHERE tbl = %s LIMIT 1', [table])
+                    row = cursor.fetchone()
+            except DatabaseError:
+                row = None
+            if row:
+                estimate = int(row[0].split()[0])
+        cache.set(key, estimate, COUNT_TIMEOUT)
+    return estimate if estimate >= 0 else None
+
+
+def page_window(number, num_pages):
+    """Номера страниц с курсором: первая, соседние и последняя."""
+    num_pages = max(num_pages, number)
+    numbers = sorted({1, number - 1, number, number + 1, num_pages}
+                     & set(range(1, num_pages + 1)))
+    pages = []
+    for position, page_number in enumerate(numbers):
+        if position and page_number - numbers[position - 1] > 1:
+            pages.append(None)
+        pages.append(page_number)
+    return pages
+
+
+def cursor_page(paginator, request, count=None):
+    """Страница по курсору с окном ссылок без OFFSET и COUNT.
+
+    count — оценка числа объектов из счётчиков или статистики; по ней
+    считаются номер и длина последней страницы. Номер из старых ссылок
+    ?page=N ещё принимается.
+    """
+    page_number = request.GET.get('page', '')
+    number = int(page_number) if page_number.isdecimal() else 1
+    if number > 1:
+        page = paginator.get_number_page(number)
+    else:
+        page = paginator.get_page(request.GET.get('cursor'))
+    last_page = paginator.num_pages
+    page.last_cursor = page.next_cursor
+    size = paginator.per_page
+    if page.has_next() and count is not None and count > last_page * size:
+        last_page = math.ceil(count / size)
+        page.last_cursor = paginator.encode_last(
+            last_page, count - (last_page - 1) * size)
+    cursors = {last_page: page.last_cursor,
+               page.number + 1: page.next_cursor,
+               page.number - 1: page.previous_cursor,
+               1: None}
+    page.last_page = last_page
+    page.page_window = [
+        (number, cursors.get(number))
+        for number in page_window(page.number, last_page)
+    ]
+    return page
+
+
+def paginate(queryset, request, ordering=POST_ORDERING, count=None):
+    return cursor_page(
+        CursorPaginator(queryset, LAST_POSTS, ordering), request, count)
 
 
-def paginate(queryset, request):
-    paginator = Paginator(queryset, LAST_POSTS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+def paginate_comments(queryset, request):
+    """Комментарии поста по курсору на дате: время не зависит от их числа."""
+    paginator = CursorPaginator(queryset, COMMENTS_PER_PAGE, COMMENT_ORDERING)
+    return paginator.get_page(request.GET.get('cursor'))
@@ -1,25 +1,36 @@
 from django.contrib.auth.decorators import login_required
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.utils.functional import SimpleLazyObject
 
-from .forms import PostForm, CommentForm
+from core.cache import cached_view, conditional_view, depend_on
+
+from . import counters, feed, follows, notifications, thumbnails
+from .search import SEARCH_ORDERING, search_posts
+from .forms import CommentForm, PostForm, lazy_post_form
+from .graph import graph
 from .models import Group, Post, User, Follow
-from .utils import paginate
+from .utils import (LAST_POSTS, cursor_page, paginate, paginate_comments,
+                    table_estimate)
 
 
-@cache_page(60 * 15)
+@conditional_view(lambda: ('posts',))
+@cached_view(lambda: ('posts',))
 def index(request):
-    page_index = paginate(Post.objects.select_related('group'), request)
-    form = PostForm(request.POST or None)
+    page_index = paginate(Post.objects.for_listing(), request,
+                          count=table_estimate(Post))
+    form = lazy_post_form(request)
     return render(request, 'posts/index.html',
                   {'page_obj': page_index, 'form': form})
 
 
+@conditional_view(lambda slug: (f'group:{slug}',))
+@cached_view(lambda slug: (f'group:{slug}',))
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.selected_posts.select_related('author')
-    page_group_posts = paginate(posts, request)
-    form = PostForm(request.POST or None)
+    posts = group.selected_posts.for_listing()
+    page_group_posts = paginate(posts, request, count=group.post_count)
+    form = lazy_post_form(request)
     context = {
         'group': group,
         'page_obj': page_group_posts,
@@ -28,20 +39,32 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
-@cache_page(60 * 15)
+def search(request):
+    query = request.GET.get('q', '').strip()
+    posts = search_posts(Post.objects.for_listing(), query)
+    context = {
+        'query': query,
+        'page_obj': paginate(posts, request, ordering=SEARCH_ORDERING),
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@conditional_view(lambda username: (f'author:{username}',))
+@cached_view(lambda username: (f'author:{username}',))
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    user_post = author.posts.select_related('author')
-    post_count = user_post.count()
-    page_profile = paginate(user_post, request)
-    form = PostForm(request.POST or None)
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    user_post = author.posts.for_listing()
+    stats = counters.author_stats(author)
+    page_profile = paginate(user_post, request, count=stats.posts_count)
+    form = lazy_post_form(request)
     following = None
     if request.user != author:
-        following = Follow.objects.filter(
-            user=request.user.id).exists()
+        following = graph.is_following(request.user.id, author.pk)
     context = {
         'author': author,
-        'post_count': post_count,
+        'post_count': stats.posts_count,
+        'stats': stats,
         'page_obj': page_profile,
         'form': form,
         'following': following,
@@ -49,18 +72,23 @@ def profile(request, username):
     return render(request, 'posts/profile.html', context)
 
 
-@cache_page(60 * 15)
+@cached_view(lambda post_id: (f'post:{post_id}',))
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    count = post.author.posts.count()
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id)
+    depend_on(request, f'author:{post.author.username}')
+    count = counters.author_stats(post.author).posts_count
     form = CommentForm(request.POST or None)
-    posts_comment = Post.objects.select_related('comments')
-    form_ = PostForm()
+    comments = paginate_comments(
+        post.comments.select_related('author').only(
+            'text', 'created', 'post', 'author', 'author__username'),
+        request)
+    form_ = SimpleLazyObject(PostForm)
     context = {
         'post': post,
         'count': count,
         'form': form,
-        'posts_comment': posts_comment,
+        'comments': comments,
         'form_': form_,
     }
     return render(request, 'posts/post_detail.html', context)
@@ -75,6 +103,9 @@ def post_create(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        if post.image:
+            thumbnails.schedule(post)
+        notifications.notify_followers.delay(post.pk)
         return redirect('posts:profile', username=request.user)
     return render(request, 'posts/create_post.html', {'form': form})
 
@@ -82,7 +113,7 @@ def post_create(request):
 @login_required
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
-    if post.author != request.user:
+    if post.author_id != request.user.pk:
         return redirect('posts:post_detail', post_id=post_id)
     form = PostForm(
         request.POST or None,
@@ -90,6 +121,8 @@ def post_edit(request, post_id):
         instance=post)
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            thumbnails.schedule(post)
         return redirect('posts:post_detail', post_id=post_id)
     context = {
         'form': form,
@@ -115,28 +148,29 @@ def add_comment(request, post_id):
 def follow_index(request):
     following = Follow.objects.filter(
         author__following__user=request.user)
-    post = (
-        Post.objects.filter(
-            author__following__user=request.user))
-    page_obj = paginate(post, request)
+    page_obj = cursor_page(feed.FeedPaginator(request.user, LAST_POSTS),
+                           request)
+    suggestions = User.objects.filter(
+        pk__in=graph.suggestions(request.user.pk)).only('username')
     context = {
         'page_obj': page_obj,
         'following': following,
+        'suggestions': suggestions,
     }
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
-    if author != request.user:
-        Follow.objects.get_or_create(user=request.user, author=author)
-    return redirect('posts:profile', author)
+    if (follows.follow(request.user, username) is None
+            and not User.objects.filter(username=username).exists()):
+        raise Http404
+    return redirect('posts:profile', username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
-    follow_query = Follow.objects.filter(author=author, user=request.user)
-    follow_query.delete()
+    if (follows.unfollow(request.user, username) is None
+            and not User.objects.filter(username=username).exists()):
+        raise Http404
     return redirect('posts:profile', username=username)
@@ -0,0 +1,151 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.test import Client
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from .models import Group, Post, User
+from .utils import LAST_POSTS, POST_ORDERING, CursorPaginator
+
+logger = logging.getLogger(__name__)
+
+# Пока ключ жив, другие процессы с общим кешем не прогревают его заново.
+WARMUP_LOCK_KEY = 'warmup:lock'
+WARMUP_LOCK_TIMEOUT: int = 60 * 5
+# Адрес не из INTERNAL_IPS, чтобы страницы рендерились без debug_toolbar,
+# как для обычного посетителя.
+VISITOR_ADDRESS = '192.0.2.1'
+
+
+def visitor_client():
+    """Тестовый клиент, который сайт видит как внешнего посетителя."""
+    return Client(REMOTE_ADDR=VISITOR_ADDRESS)
+
+
+def page_urls(url, queryset, pages):
+    """Адреса первых pages страниц ленты с курсорами, как у paginate."""
+    paginator = CursorPaginator(queryset, LAST_POSTS)
+    ordered = paginator.object_list.only(
+        *(name.lstrip('-') for name in POST_ORDERING))
+    yield url
+    for number in range(2, pages + 1):
+        # Последний пост предыдущей страницы и первый пост этой.
+        position = (number - 1) * LAST_POSTS - 1
+        boundary = ordered[position:position + 2]
+        if len(boundary) < 2:
+            return
+        cursor = paginator.encode_cursor(boundary[0], 'next', number)
+        # Так же, как page_url в шаблоне пагинатора: ключ кеша
+        # строится по полному адресу.
+        yield f'{url}?{urlencode({"cursor": cursor})}'
+
+
+def index_urls(pages):
+    return page_urls(reverse('posts:index'), Post.objects.all(), pages)
+
+
+def group_urls(pages, limit=None):
+    """Страницы групп, начиная с самых наполненных."""
+    groups = Group.objects.filter(post_count__gt=0).order_by('-post_count')
+    for group in groups[:limit]:
+        yield from page_urls(
+            reverse('posts:group_posts', kwargs={'slug': group.slug}),
+            group.selected_posts.all(), pages)
+
+
+def author_urls(pages, limit):
+    """Профили авторов с наибольшим числом подписчиков и постов."""
+    authors = User.objects.filter(stats__posts_count__gt=0).order_by(
+        '-stats__followers_count', '-stats__posts_count')
+    for author in authors[:limit]:
+        yield from page_urls(
+            reverse('posts:profile', kwargs={'username': author.username}),
+            author.posts.all(), pages)
+
+
+def post_urls(limit):
+    """Страницы самых обсуждаемых постов."""
+    post_ids = Post.objects.order_by('-comment_count', '-pk').values_list(
+        'pk', flat=True)
+    for post_id in post_ids[:limit]:
+        yield reverse('posts:post_detail', kwargs={'post_id': post_id})
+
+
+def listing_urls(pages):
+    """Адреса страниц главной и всех групп для прогрева."""
+    yield from index_urls(pages)
+    yield from group_urls(pages)
+
+
+def fetch(url):
+    """Запрашивает страницу как анонимный посетитель.
+
+    Возвращает код ответа и время в миллисекундах.
+    """
+    started = time.perf_counter()
+    response = visitor_client().get(url)
+    return response.status_code, (time.perf_counter() - started) * 1000
+
+
+def _closing_connections(func, item):
+    try:
+        return func(item)
+    finally:
+        close_old_connections()
+
+
+def parallel_map(func, items, workers=1):
+    """Применяет func к items в workers потоков, сохраняя порядок.
+
+    При workers = 1 всё выполняется в текущем потоке.
+    """
+    if workers <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers,
+                            thread_name_prefix='warmup') as executor:
+        return list(executor.map(
+            lambda item: _closing_connections(func, item), items))
+
+
+def warm_urls(urls, workers=1):
+    """Запрашивает адреса; возвращает пары (адрес, (код, мс))."""
+    urls = list(urls)
+    return list(zip(urls, parallel_map(fetch, urls, workers)))
+
+
+def warm_up(pages=None):
+    """Заполняет кеш страницами для анонимного посетителя.
+
+    Возвращает число запрошенных страниц.
+    """
+    if pages is None:
+        pages = settings.CACHE_WARMUP_PAGES
+    return len(warm_urls(listing_urls(pages)))
+
+
+def _run():
+    started = time.perf_counter()
+    try:
+        count = warm_up()
+    except Exception:
+        logger.exception('Не удалось прогреть кеш')
+    else:
+        logger.info('Кеш прогрет: %s страниц за %.1f с',
+                    count, time.perf_counter() - started)
+    finally:
+        close_old_connections()
+
+
+def warm_up_in_background():
+    """Прогревает кеш в фоновом потоке при старте процесса."""
+    if not settings.CACHE_WARMUP_PAGES:
+        return
+    if not cache.add(WARMUP_LOCK_KEY, True, WARMUP_LOCK_TIMEOUT):
+        return
+    threading.Thread(target=_run, name='cache-warmup', daemon=True).start()
@@ -31,6 +31,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryStatsMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -66,13 +68,63 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
+# Профиль SQLite выбирается переменной окружения SQLITE_PROFILE:
+# django — журнал и соединения как у Django по умолчанию, wal — журнал
+# WAL, в котором читатели не ждут писателя, и постоянные соединения.
+# Прагмы профиля выполняются на каждом новом соединении (core.db).
+SQLITE_PROFILES = {
+    'django': {
+        'CONN_MAX_AGE': 0,
+        'PRAGMAS': {
+            'journal_mode': 'DELETE',
+            'synchronous': 'FULL',
+        },
+    },
+    'wal': {
+        'CONN_MAX_AGE': 600,
+        'PRAGMAS': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'mmap_size': 256 * 1024 * 1024,
+            # Отрицательное значение задаёт размер в КиБ, а не в страницах.
+            'cache_size': -64 * 1024,
+            'busy_timeout': 5000,
+            'temp_store': 'MEMORY',
+        },
+    },
+}
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'wal')
+SQLITE_PRAGMAS = SQLITE_PROFILES[SQLITE_PROFILE]['PRAGMAS']
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': SQLITE_PROFILES[SQLITE_PROFILE]['CONN_MAX_AGE'],
     }
 }
 
+# Реплика для чтения лент включается переменной окружения
+# DATABASE_REPLICA с путём к файлу. Локально реплику наполняет
+# manage.py sync_replica. После записи посетитель читает из основной
+# базы REPLICA_STICKY_SECONDS секунд, поэтому реплика должна
+# обновляться чаще.
+REPLICA_DATABASE = os.environ.get('DATABASE_REPLICA')
+REPLICA_ENABLED = bool(REPLICA_DATABASE)
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'NAME': REPLICA_DATABASE or os.path.join(BASE_DIR, 'db-replica.sqlite3'),
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_ROUTERS = ['core.db.ReplicaRouter']
+REPLICA_APPS = ('posts',)
+REPLICA_VIEWS = ('posts:index', 'posts:group_posts', 'posts:profile',
+                 'posts:post_detail', 'posts:follow_index', 'posts:api_index',
+                 'posts:api_group_posts', 'posts:api_profile')
+REPLICA_STICKY_SECONDS = 10
+# Страница из отстающей реплики не должна долго жить в кеше.
+REPLICA_CACHE_TIMEOUT = 60
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -88,11 +140,51 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
-CACHES = {
-    'default': {
+# Кеш выбирается переменной окружения CACHE_BACKEND. locmem у каждого
+# процесса свой; file и sqlite общие для процессов одного сервера
+# (для sqlite нужен manage.py createcachetable); redis и memcached
+# требуют django-redis и pylibmc.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+# Сброс поколения в locmem видит только процесс, обработавший запись,
+# поэтому с ним страницы и поколения живут недолго.
+CACHE_SHARED = CACHE_BACKEND != 'locmem'
+VIEW_CACHE_TIMEOUT = 60 * 60 * 6 if CACHE_SHARED else 60 * 15
+CACHE_LOCATION = os.environ.get('CACHE_LOCATION')
+CACHE_BACKENDS = {
+    'locmem': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_LOCATION or os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'sqlite': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': CACHE_LOCATION or 'cache_entries',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'redis': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': CACHE_LOCATION or 'redis://127.0.0.1:6379/1',
+        'OPTIONS': {
+            'CONNECTION_POOL_KWARGS': {'max_connections': 50},
+        },
+    },
+    'memcached': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyLibMCCache',
+        'LOCATION': CACHE_LOCATION or '127.0.0.1:11211',
+        'OPTIONS': {
+            'binary': True,
+            'behaviors': {'tcp_nodelay': True, 'ketama': True},
+        },
+    },
 }
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE_BACKEND],
+}
+# Сколько первых страниц главной и каждой группы прогревать при старте.
+CACHE_WARMUP_PAGES = int(os.environ.get('CACHE_WARMUP_PAGES', 3))
 
 LANGUAGE_CODE = 'ru'
 
@@ -111,9 +203,54 @@ LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
-EMAIL_FILE_PATH = [os.path.join(BASE_DIR, 'sent_emails')]
+EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Фоновые задачи (core.tasks) хранятся в таблице core_task. Их разбирают
+# TASK_WORKERS потоков в процессе сайта и manage.py run_worker; при 0
+# потоков очередь разбирает только run_worker. При TASKS_EAGER задачи
+# выполняются сразу, в том же запросе; так работают тесты.
+TASK_WORKERS = int(os.environ.get('TASK_WORKERS', 2))
+TASKS_EAGER = False
+TEST_RUNNER = 'core.testing.TestRunner'
+
+# Уведомления о новых постах: письмо на каждый пост или сводка раз в час.
+NOTIFICATIONS_DIGEST = os.environ.get('NOTIFICATIONS_DIGEST') == '1'
+# Адрес сайта для ссылок в письмах.
+SITE_URL = os.environ.get('SITE_URL', 'http://127.0.0.1:8000')
+
+# Сколько запросов к БД может выполнить представление без кеша.
+QUERY_BUDGETS = {
+    'posts:index': 4,
+    'posts:group_posts': 5,
+    'posts:profile': 6,
+    'posts:post_detail': 5,
+    'posts:follow_index': 6,
+    'posts:search': 4,
+    'posts:api_index': 1,
+    'posts:api_group_posts': 2,
+    'posts:api_profile': 2,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        # INFO пишет итоги каждого запроса, WARNING — только превышения
+        # бюджета.
+        'core.queries': {
+            'handlers': ['console'],
+            'level': os.environ.get('QUERY_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
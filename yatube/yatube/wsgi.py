@@ -5,3 +5,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
 application = get_wsgi_application()
+
+from core.tasks import start_workers  # noqa: E402
+from posts.warmup import warm_up_in_background  # noqa: E402
+
+start_workers()
+warm_up_in_background()